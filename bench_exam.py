@@ -0,0 +1,267 @@
+"""Benchmark alur ujian Lulusin secara headless (Streamlit AppTest + file libsql lokal).
+
+Setiap siswa virtual menjalankan: login -> buka menu Ujian -> buka kategori -> MULAI UJIAN ->
+jawab + navigasi tiap soal -> kirim. Dua fase:
+  1. profil  : beberapa siswa berjalan serial -> round trip DB per aksi, memori per sesi (tracemalloc)
+  2. beban   : --concurrency proses worker mulai serentak, masing-masing menjalankan siswanya
+               berurutan -> persentil latensi rerun per aksi, error, throughput
+
+AppTest mengganti singleton global (Runtime, st.secrets) di setiap run sehingga tidak aman
+dijalankan paralel dalam satu proses; karena itu konkurensi memakai proses. Tiap worker
+setara satu instance server (cache & pool koneksi sendiri) yang berbagi file DB yang sama.
+
+Contoh:
+    python bench_exam.py --students 300 --concurrency 300 --questions 40 --latency-ms 30
+
+Hasil ditambahkan ke .lulusin_store/bench/results.jsonl dan dibandingkan dengan run
+sebelumnya yang konfigurasinya sama.
+"""
+import argparse
+import importlib
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+import multiprocessing as mp
+from datetime import datetime, timedelta
+
+import numpy as np
+import pytz
+import libsql_experimental
+from streamlit.testing.v1 import AppTest
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+APP = os.path.join(ROOT, "lms.py")
+RESULTS = os.path.join(ROOT, ".lulusin_store", "bench", "results.jsonl")
+CAT = "Bench"
+PASSWORD = "bench"
+ACTIONS = ["login", "menu", "open_exam", "start", "answer", "next", "submit"]
+
+# --- LATENSI JARINGAN TIRUAN & PENGHITUNG ROUND TRIP ---
+class Wire:
+    # Setiap execute / executemany / commit dihitung 1 round trip dan ditahan selama latensi tiruan
+    def __init__(self, latency_ms):
+        self.latency = latency_ms / 1000
+        self.lock = threading.Lock()
+        self.trips = 0
+
+    def trip(self):
+        with self.lock: self.trips += 1
+        if self.latency: time.sleep(self.latency)
+
+class _Cursor:
+    def __init__(self, cur, wire): self._cur, self._wire = cur, wire
+    def execute(self, *a): self._wire.trip(); self._cur.execute(*a); return self
+    def executemany(self, *a): self._wire.trip(); self._cur.executemany(*a); return self
+    def __getattr__(self, k): return getattr(self._cur, k)
+
+class _Conn:
+    def __init__(self, conn, wire): self._conn, self._wire = conn, wire
+    def cursor(self): return _Cursor(self._conn.cursor(), self._wire)
+    def execute(self, *a): self._wire.trip(); return _Cursor(self._conn.execute(*a), self._wire)
+    def executemany(self, *a): self._wire.trip(); return _Cursor(self._conn.executemany(*a), self._wire)
+    def commit(self): self._wire.trip(); self._conn.commit()
+    def __getattr__(self, k): return getattr(self._conn, k)
+
+_libsql_connect = libsql_experimental.connect
+BUSY_TIMEOUT_MS = 30000
+
+def _connect(*a, **k):
+    # Server Turso mengantrekan penulisan; file lokal yang dibuka banyak proses perlu busy_timeout agar setara
+    conn = _libsql_connect(*a, **k)
+    conn.execute(f"PRAGMA busy_timeout = {BUSY_TIMEOUT_MS}")
+    return conn
+
+def install_wire(latency_ms):
+    # lms.py memanggil libsql_experimental.connect saat runtime, jadi patch modul cukup
+    wire = Wire(latency_ms)
+    libsql_experimental.connect = lambda *a, **k: _Conn(_connect(*a, **k), wire)
+    return wire
+
+# --- DATA UJI ---
+def wib_now(): return datetime.now(pytz.timezone('Asia/Jakarta')).replace(tzinfo=None)
+
+def seed(db, students, questions):
+    fmt = lambda d: d.strftime("%Y-%m-%d %H:%M:%S")
+    c = _connect(db)
+    c.execute("PRAGMA journal_mode = WAL")
+    c.executemany("INSERT INTO users (username, password, role, name) VALUES (?, ?, ?, ?)", [(f"bench{i:04}", PASSWORD, "student", f"Siswa Bench {i:04}") for i in range(students)])
+    c.executemany("INSERT INTO exams (category, sub_category, question, opt_a, opt_b, opt_c, opt_d, answer) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                  [(CAT, f"Sub {i % 4}", f"Soal benchmark nomor {i}: berapakah {i} + {i}?", str(2 * i), str(2 * i + 1), str(2 * i + 2), str(2 * i - 1), str(2 * i)) for i in range(questions)])
+    now = wib_now()
+    c.execute("INSERT OR REPLACE INTO exam_schedules (category, open_time, close_time, duration_minutes, max_attempts) VALUES (?, ?, ?, ?, ?)", (CAT, fmt(now - timedelta(minutes=1)), fmt(now + timedelta(hours=3)), 120, 1))
+    c.commit()
+
+def new_app(db, timeout):
+    at = AppTest.from_file(APP, default_timeout=timeout)
+    at.secrets["turso"] = {"db_url": db, "auth_token": ""}
+    return at
+
+# --- SISWA VIRTUAL ---
+class BenchError(Exception): pass
+
+def student_flow(user, db, timeout, record, think_s=0.0):
+    # record(aksi, ms) dipanggil setiap aksi; mengembalikan AppTest agar sesi tetap hidup
+    at = new_app(db, timeout)
+
+    def act(name, fn):
+        t0 = time.perf_counter()
+        fn()
+        record(name, (time.perf_counter() - t0) * 1000)
+        if at.exception: raise BenchError(f"{user} {name}: {at.exception[0].value}")
+        if think_s: time.sleep(random.uniform(0, think_s))
+
+    at.run()
+    def login():
+        at.text_input[0].set_value(user); at.text_input[1].set_value(PASSWORD)
+        next(b for b in at.button if b.label == "Masuk").click().run()
+    act("login", login)
+    act("menu", lambda: at.radio(key="student_section").set_value("📝 Ujian").run())
+    act("open_exam", lambda: at.button(key=f"open_{CAT}").click().run())
+    start = [b for b in at.button if "MULAI" in b.label]
+    if not start: raise BenchError(f"{user}: tombol MULAI UJIAN tidak muncul ({[i.value for i in at.error + at.warning + at.info]})")
+    act("start", lambda: start[0].click().run())
+    while True:
+        rad = [r for r in at.radio if r.key and r.key.startswith("rad_")]
+        if not rad: raise BenchError(f"{user}: soal tidak tampil")
+        act("answer", lambda: rad[0].set_value(random.choice(rad[0].options)).run())
+        nxt = [b for b in at.button if "Selanjutnya" in b.label]
+        if not nxt: break
+        act("next", lambda: nxt[0].click().run())
+    act("submit", lambda: next(b for b in at.button if "Kirim" in b.label).click().run())
+    return at
+
+# --- FASE ---
+def profile_phase(db, wire, users, timeout):
+    # Serial: round trip per aksi tanpa gangguan siswa lain, memori sesi via tracemalloc
+    trips = {}
+    def record(name, ms):
+        d = wire.trips - record.last; record.last = wire.trips
+        trips.setdefault(name, []).append(d)
+    # Biaya tetap AppTest per rerun (kompilasi skrip + halaman login) sebagai pembanding latensi
+    at = new_app(db, timeout); at.run()
+    t0 = time.perf_counter(); at.run(); baseline = (time.perf_counter() - t0) * 1000
+    tracemalloc.start()
+    base = tracemalloc.get_traced_memory()[0]
+    alive = []
+    for u in users:
+        record.last = wire.trips
+        alive.append(student_flow(u, db, timeout, record))
+    cur, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {
+        "round_trips": {a: round(float(np.mean(trips[a])), 2) for a in ACTIONS if a in trips},
+        "round_trips_flow": round(sum(float(np.sum(v)) for v in trips.values()) / len(users), 1),
+        "mem_per_session_kb": round((cur - base) / len(users) / 1024, 1),
+        "mem_peak_kb": round((peak - base) / 1024, 1),
+        "baseline_rerun_ms": round(baseline, 1),
+    }
+
+def _load_worker(i, n, db, users, latency_ms, ramp_s, think_s, timeout, barrier, out):
+    install_wire(latency_ms)
+    lat, errors = [], []
+    try: new_app(db, timeout).run()  # pemanasan: import & kompilasi skrip di luar pengukuran
+    except Exception as e: errors.append(f"warmup: {e}")
+    barrier.wait()
+    if ramp_s: time.sleep(ramp_s * i / n)
+    for u in users:
+        try: student_flow(u, db, timeout, lambda name, ms: lat.append((name, ms)), think_s)
+        except Exception as e: errors.append(str(e)[:300])
+    out.put((lat, errors)); out.close(); out.join_thread()
+    # Jangan tunggu thread latar belakang aplikasi (sweeper, journal)
+    sys.stdout.flush(); os._exit(0)
+
+def load_phase(db, users, concurrency, latency_ms, ramp_s, think_s, timeout):
+    ctx = mp.get_context("spawn")
+    n = min(concurrency, len(users))
+    barrier, out = ctx.Barrier(n + 1), ctx.Queue()
+    # AppTest mengganti sys.modules["__main__"] saat run, jadi target diambil lewat nama modul
+    worker = importlib.import_module("bench_exam")._load_worker
+    procs = [ctx.Process(target=worker, args=(i, n, db, users[i::n], latency_ms, ramp_s, think_s, timeout, barrier, out)) for i in range(n)]
+    for p in procs: p.start()
+    barrier.wait()
+    t0 = time.perf_counter()
+    lat, errors = {}, []
+    for _ in procs:
+        l, e = out.get()
+        for name, ms in l: lat.setdefault(name, []).append(ms)
+        errors.extend(e)
+    wall = time.perf_counter() - t0
+    for p in procs: p.join()
+    out = {}
+    for a in ACTIONS:
+        v = np.array(lat.get(a, []))
+        if len(v): out[a] = {"n": int(len(v)), "p50": round(float(np.percentile(v, 50)), 1), "p95": round(float(np.percentile(v, 95)), 1), "p99": round(float(np.percentile(v, 99)), 1), "max": round(float(v.max()), 1)}
+    return {"latency_ms": out, "errors": len(errors), "error_samples": errors[:5], "wall_s": round(wall, 2), "flows_per_s": round((len(users) - len(errors)) / wall, 2)}
+
+# --- HASIL ---
+def git_rev():
+    try:
+        rev = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True).stdout.strip()
+        dirty = bool(subprocess.run(["git", "status", "--porcelain", "--", "lms.py"], cwd=ROOT, capture_output=True, text=True).stdout.strip())
+        return rev + ("+dirty" if dirty else "") if rev else None
+    except OSError: return None
+
+def previous_result(path, config):
+    if not os.path.exists(path): return None
+    last = None
+    with open(path) as f:
+        for line in f:
+            r = json.loads(line)
+            if r.get("config") == config: last = r
+    return last
+
+def report(res, prev):
+    fmt = lambda cur, old: f"{cur}" if old is None else f"{cur} ({cur - old:+.1f})"
+    print(f"\n=== {res['rev']} · {res['time']} · {json.dumps(res['config'])}")
+    if prev: print(f"    dibandingkan dengan {prev['rev']} · {prev['time']}")
+    pl = prev["load"]["latency_ms"] if prev else {}
+    pt = prev["profile"]["round_trips"] if prev else {}
+    print(f"{'aksi':<10}{'n':>6}{'p50 ms':>16}{'p95 ms':>18}{'p99 ms':>18}{'round trip':>16}")
+    for a, v in res["load"]["latency_ms"].items():
+        o = pl.get(a, {})
+        print(f"{a:<10}{v['n']:>6}{fmt(v['p50'], o.get('p50')):>16}{fmt(v['p95'], o.get('p95')):>18}{fmt(v['p99'], o.get('p99')):>18}{fmt(res['profile']['round_trips'].get(a, 0), pt.get(a)):>16}")
+    p, l = res["profile"], res["load"]
+    print(f"round trip / alur: {p['round_trips_flow']} · memori / sesi: {p['mem_per_session_kb']} KB (peak {p['mem_peak_kb']} KB) · rerun login kosong: {p['baseline_rerun_ms']} ms")
+    print(f"wall: {l['wall_s']} s · {l['flows_per_s']} alur/s · error: {l['errors']}")
+    for e in l["error_samples"]: print(f"  ! {e}")
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--students", type=int, default=40)
+    ap.add_argument("--concurrency", type=int, default=8, help="jumlah proses worker yang berjalan bersamaan")
+    ap.add_argument("--questions", type=int, default=20)
+    ap.add_argument("--latency-ms", type=float, default=0, help="latensi tiruan per round trip DB")
+    ap.add_argument("--ramp-s", type=float, default=0, help="sebar waktu mulai siswa (0 = serentak)")
+    ap.add_argument("--think-s", type=float, default=0, help="jeda acak maksimum antar aksi")
+    ap.add_argument("--profile-students", type=int, default=3)
+    ap.add_argument("--timeout", type=float, default=120, help="batas waktu per rerun AppTest (detik)")
+    ap.add_argument("--out", default=RESULTS)
+    ap.add_argument("--no-save", action="store_true")
+    args = ap.parse_args()
+
+    config = {k: getattr(args, k) for k in ("students", "concurrency", "questions", "latency_ms", "ramp_s", "think_s")}
+    wire = install_wire(args.latency_ms)
+    with tempfile.TemporaryDirectory() as tmp:
+        db = os.path.join(tmp, "bench.db")
+        new_app(db, args.timeout).run()  # migrasi skema
+        seed(db, args.students + args.profile_students, args.questions)
+        users = [f"bench{i:04}" for i in range(args.students + args.profile_students)]
+        prof = profile_phase(db, wire, users[args.students:], args.timeout)
+        load = load_phase(db, users[:args.students], args.concurrency, args.latency_ms, args.ramp_s, args.think_s, args.timeout)
+
+    res = {"time": wib_now().strftime("%Y-%m-%d %H:%M:%S"), "rev": git_rev(), "python": sys.version.split()[0], "config": config, "profile": prof, "load": load}
+    prev = previous_result(args.out, config)
+    report(res, prev)
+    if not args.no_save:
+        os.makedirs(os.path.dirname(args.out), exist_ok=True)
+        with open(args.out, "a") as f: f.write(json.dumps(res) + "\n")
+    # Jangan tunggu thread latar belakang aplikasi (sweeper, journal)
+    sys.stdout.flush(); os._exit(1 if load["errors"] else 0)
+
+if __name__ == "__main__": main()
@@ -1,11 +1,24 @@
 import streamlit as st
 import streamlit.components.v1 as components
 import pandas as pd
+import numpy as np
 from datetime import datetime, timedelta
 import time
 import base64
 import io
 import pytz 
+import json
+import functools
+from contextlib import contextmanager
+import random
+import openpyxl
+from PIL import Image, ImageOps
+import os
+import hashlib
+import re
+import sys
+import threading
+from collections import OrderedDict, deque
 
 # MENGGUNAKAN LIBSQL (TURSO)
 import libsql_experimental as sqlite3 
@@ -48,18 +61,8 @@ st.markdown("""
         background-color: var(--bg-card);
     }
 
-    /* 4. NAVIGASI SIDEBAR BULAT (DOTS) */
-    [data-testid="stSidebar"] button {
-        border-radius: 50% !important;
-        width: 40px !important;
-        height: 40px !important;
-        padding: 0 !important;
-        font-weight: bold !important;
-        font-size: 14px !important;
-        margin: 2px !important;
-        box-shadow: 0 2px 4px rgba(0,0,0,0.1);
-        border: 1px solid rgba(0,0,0,0.1);
-    }
+    /* 4. NAVIGASI SOAL (PILLS) */
+    .st-key-nav_pick button { min-width: 3.4rem; justify-content: center; font-weight: bold; }
     
     /* 5. General Buttons */
     .exam-card-header { font-size: 1.2rem; font-weight: 700; margin-bottom: 5px; }
@@ -88,37 +91,275 @@ st.markdown("""
 # 2. DATABASE MANAGER (TURSO + CACHE)
 # ==========================================
 
-@st.cache_resource(ttl=3600)
-def get_db_connection():
-    try:
-        url = st.secrets["turso"]["db_url"]
-        token = st.secrets["turso"]["auth_token"]
-        conn = sqlite3.connect(url, auth_token=token)
-        return conn
-    except Exception as e:
-        st.error(f"Koneksi Database Gagal: {e}")
-        return None
+# --- CONNECTION POOL + EMBEDDED REPLICA ---
+DB_POOL_MAX_IDLE = 8
+DB_HEALTH_CHECK_INTERVAL = 30
+REPLICA_SYNC_INTERVAL = 5
+
+class StaleConnectionError(Exception):
+    # Query gagal karena koneksinya mati (sudah dibuang dari pool); satu-satunya error yang layak dicoba ulang
+    pass
+
+class ConnectionPool:
+    # Koneksi dipinjam per thread selama query/transaksi lalu dikembalikan.
+    # Mode: remote (libsql://...), file lokal (db_url tanpa "://", untuk testing offline),
+    # atau embedded replica (replica_path): baca dari file lokal + sync, tulis ke primary.
+    def __init__(self, url, token=None, replica_path=None, sync_interval=REPLICA_SYNC_INTERVAL):
+        self.url, self.token = url, token
+        self.replica_path, self.sync_interval = replica_path, sync_interval
+        self._idle = {'primary': [], 'replica': []}
+        self._lock = threading.Lock()
+        self._sync_lock = threading.Lock()
+        self._last_sync, self._dirty = 0.0, True
+
+    @property
+    def is_local(self): return "://" not in self.url
+
+    def _connect(self, kind):
+        try:
+            if kind == 'replica': return sqlite3.connect(self.replica_path, sync_url=self.url, auth_token=self.token)
+            if self.is_local: return sqlite3.connect(self.url)
+            return sqlite3.connect(self.url, auth_token=self.token)
+        except Exception as e:
+            raise ConnectionError(e) from e
+
+    @staticmethod
+    def _healthy(conn):
+        try: conn.execute("SELECT 1").fetchall(); return True
+        except (KeyboardInterrupt, SystemExit): raise
+        except BaseException: return False  # libsql dapat melempar PanicException (bukan Exception) pada koneksi mati
+
+    def _acquire(self, kind):
+        with self._lock:
+            entry = self._idle[kind].pop() if self._idle[kind] else None
+        if entry:
+            conn, last_used = entry
+            if time.time() - last_used < DB_HEALTH_CHECK_INTERVAL or self._healthy(conn): return conn
+            self._close(conn)
+        return self._connect(kind)
+
+    def _release(self, kind, conn):
+        with self._lock:
+            if len(self._idle[kind]) < DB_POOL_MAX_IDLE:
+                self._idle[kind].append((conn, time.time())); return
+        self._close(conn)
+
+    @staticmethod
+    def _close(conn):
+        try: conn.close()
+        except Exception: pass
+
+    def _sync_replica(self, conn):
+        with self._sync_lock:
+            if self._dirty or time.time() - self._last_sync >= self.sync_interval:
+                conn.sync(); self._last_sync, self._dirty = time.time(), False
+
+    @contextmanager
+    def connection(self, write=True):
+        kind = 'replica' if self.replica_path and not write else 'primary'
+        conn = self._acquire(kind)
+        try:
+            if kind == 'replica': self._sync_replica(conn)
+            yield conn
+        except Exception as e:
+            try: conn.rollback()
+            except Exception: pass
+            # Koneksi rusak dibuang, pemanggil berikutnya mendapat koneksi baru
+            if not self._healthy(conn):
+                self._close(conn); conn = None
+                raise StaleConnectionError(e) from e
+            raise
+        finally:
+            if write: self._dirty = True
+            if conn is not None: self._release(kind, conn)
+
+@st.cache_resource
+def get_db_pool():
+    cfg = st.secrets["turso"]
+    return ConnectionPool(cfg["db_url"], cfg.get("auth_token"), cfg.get("replica_path"), cfg.get("sync_interval", REPLICA_SYNC_INTERVAL))
+
+def db_connection(write=True): return get_db_pool().connection(write)
+
+# --- INSTRUMENTASI QUERY ---
+SLOW_QUERY_MS = 200
+QUERY_STATS_SAMPLES = 1000
+SLOW_QUERY_LOG_SIZE = 200
+RERUN_LOG_SIZE = 500
+_QUERY_LAYER_FUNCS = {"_execute", "run_query", "query_df", "query_scalar", "query_iter", "_record_query"}
+
+def _result_size(res):
+    # (jumlah baris, perkiraan byte) dari hasil query
+    if isinstance(res, pd.DataFrame): return len(res), int(res.memory_usage(deep=True).sum())
+    if isinstance(res, list): return len(res), sum(len(v) for r in res for v in r.values() if isinstance(v, (bytes, str)))
+    if isinstance(res, dict): return 1, sum(len(v) for v in res.values() if isinstance(v, (bytes, str)))
+    return (0, 0) if res is True else (1, len(res) if isinstance(res, (bytes, str)) else 8)
+
+def _query_caller():
+    # Nama helper pertama di luar query layer (mis. get_schedule, submit_student_exam)
+    f = sys._getframe(2)
+    while f and f.f_code.co_name in _QUERY_LAYER_FUNCS: f = f.f_back
+    return f.f_code.co_name if f else "?"
+
+class QueryStats:
+    # Statistik per query (template SQL) dan per rerun Streamlit, plus log query lambat
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.per_query = {}
+            self.slow_log = deque(maxlen=SLOW_QUERY_LOG_SIZE)
+            self.reruns = deque(maxlen=RERUN_LOG_SIZE)
+            self.started = time.time()
+
+    def record(self, sql, ms, rows, nbytes, caller, error=None):
+        with self._lock:
+            q = self.per_query.get(sql)
+            if q is None:
+                q = self.per_query[sql] = {"count": 0, "errors": 0, "rows": 0, "bytes": 0, "callers": set(), "ms": deque(maxlen=QUERY_STATS_SAMPLES)}
+            q["count"] += 1; q["rows"] += rows; q["bytes"] += nbytes; q["ms"].append(ms); q["callers"].add(caller)
+            if error: q["errors"] += 1
+            if ms >= SLOW_QUERY_MS or error:
+                self.slow_log.append({"time": get_wib_now().strftime("%Y-%m-%d %H:%M:%S"), "caller": caller, "ms": round(ms, 1), "rows": rows, "bytes": nbytes, "error": error, "sql": sql})
+        run = getattr(self._local, "run", None)
+        if run is not None:
+            run["queries"] += 1; run["db_ms"] += ms; run["rows"] += rows; run["bytes"] += nbytes
+
+    def begin_rerun(self, label):
+        self._local.run = {"label": label, "queries": 0, "db_ms": 0.0, "rows": 0, "bytes": 0, "t0": time.perf_counter()}
+
+    def end_rerun(self):
+        run = getattr(self._local, "run", None)
+        if run is None: return
+        self._local.run = None
+        run["total_ms"] = (time.perf_counter() - run.pop("t0")) * 1000
+        with self._lock: self.reruns.append(run)
+
+    @contextmanager
+    def rerun(self, label):
+        # Rerun fragment tidak melewati main(); dicatat sendiri kecuali sedang di dalam rerun penuh
+        if getattr(self._local, "run", None) is not None:
+            yield; return
+        self.begin_rerun(label)
+        try: yield
+        finally: self.end_rerun()
+
+    def query_table(self):
+        with self._lock:
+            rows = [(sql, q["count"], q["errors"], np.array(q["ms"]), q["rows"], q["bytes"], ", ".join(sorted(q["callers"]))) for sql, q in self.per_query.items()]
+        out = []
+        for sql, n, err, ms, r, b, callers in rows:
+            p50, p95, p99 = np.percentile(ms, [50, 95, 99]) if len(ms) else (0, 0, 0)
+            out.append({"caller": callers, "count": n, "errors": err, "p50_ms": round(p50, 1), "p95_ms": round(p95, 1), "p99_ms": round(p99, 1), "max_ms": round(ms.max(), 1) if len(ms) else 0, "total_ms": round(ms.sum(), 1), "rows": r, "bytes": b, "sql": sql})
+        return pd.DataFrame(out).sort_values("total_ms", ascending=False) if out else pd.DataFrame()
+
+    def rerun_table(self):
+        with self._lock: return pd.DataFrame(list(self.reruns))
+
+    def export_json(self):
+        with self._lock: slow = list(self.slow_log)
+        return json.dumps({"since": self.started, "queries": self.query_table().to_dict("records"), "reruns": self.rerun_table().to_dict("records"), "slow_log": slow}, indent=2, default=str)
+
+@st.cache_resource
+def get_query_stats(): return QueryStats()
+
+def _record_query(sql, t0, res=None, error=None):
+    rows, nbytes = _result_size(res) if error is None else (0, 0)
+    get_query_stats().record(sql, (time.perf_counter() - t0) * 1000, rows, nbytes, _query_caller(), error)
+
+# --- QUERY LAYER ---
+QUERY_STREAM_BATCH = 500
+READ_PREFIXES = ("SELECT", "WITH", "PRAGMA", "EXPLAIN")
+
+class QueryError(Exception):
+    pass
+
+@functools.lru_cache(maxsize=256)
+def _prepare(query):
+    # Parse sekali per teks query: normalisasi + klasifikasi baca/tulis (menggantikan startswith per panggilan)
+    sql = query.strip()
+    return sql, sql.upper().startswith(READ_PREFIXES)
+
+def _execute(query, params, fetch):
+    sql, is_read = _prepare(query)
+    err = None
+    # SELECT dicoba ulang sekali hanya jika koneksinya mati (sudah diganti oleh pool);
+    # error lain (kolom tidak ada, query FTS salah, ...) langsung dilempar
+    for attempt in range(2 if is_read else 1):
+        t0 = time.perf_counter()
+        try:
+            with db_connection(write=not is_read) as conn:
+                c = conn.cursor()
+                c.execute(sql, params)
+                if is_read: res = fetch(c)
+                else:
+                    res = fetch(c) if c.description else True
+                    conn.commit()
+            _record_query(sql, t0, res)
+            return res
+        except ConnectionError as e:
+            _record_query(sql, t0, error=str(e))
+            raise QueryError(f"Koneksi Database Gagal: {e}") from e
+        except StaleConnectionError as e:
+            _record_query(sql, t0, error=str(e))
+            err = e.__cause__ or e
+        except Exception as e:
+            _record_query(sql, t0, error=str(e))
+            raise QueryError(f"{e} [{sql[:120]}]") from e
+    raise QueryError(f"{err} [{sql[:120]}]") from err
+
+def _fetch_dicts(c):
+    cols = [description[0] for description in c.description]
+    return [dict(zip(cols, row)) for row in c.fetchall()]
 
 def run_query(query, params=()):
-    conn = get_db_connection()
-    if not conn: return None
-    c = conn.cursor()
+    # List of dict (SELECT) atau True (tulis); error dilempar sebagai QueryError
+    return _execute(query, params, _fetch_dicts)
+
+def query_df(query, params=()):
+    # Fetch kolom-oriented: tuple langsung ke DataFrame tanpa dict per baris
+    return _execute(query, params, lambda c: pd.DataFrame.from_records(c.fetchall(), columns=[d[0] for d in c.description]))
+
+def query_scalar(query, params=(), default=None):
+    def fetch(c):
+        row = c.fetchone()
+        return row[0] if row and row[0] is not None else default
+    return _execute(query, params, fetch)
+
+def query_iter(query, params=(), batch_size=QUERY_STREAM_BATCH):
+    # Iterator streaming (fetchmany), koneksi dipinjam sampai iterator habis / ditutup
+    sql, _ = _prepare(query)
+    t0 = time.perf_counter(); n = nbytes = 0
     try:
-        c.execute(query, params)
-        if query.strip().upper().startswith("SELECT"):
-            cols = [description[0] for description in c.description]
-            data = c.fetchall()
-            result = [dict(zip(cols, row)) for row in data]
-            return result
-        else:
-            conn.commit()
-            return True
+        with db_connection(write=False) as conn:
+            c = conn.cursor()
+            c.execute(sql, params)
+            cols = [d[0] for d in c.description]
+            while True:
+                rows = c.fetchmany(batch_size)
+                if not rows: break
+                n += len(rows); nbytes += sum(len(v) for row in rows for v in row if isinstance(v, (bytes, str)))
+                for row in rows: yield dict(zip(cols, row))
+    except ConnectionError as e:
+        _record_query(sql, t0, error=str(e))
+        raise QueryError(f"Koneksi Database Gagal: {e}") from e
     except Exception as e:
-        # print(f"Query Error: {e}")
-        return []
+        _record_query(sql, t0, error=str(e))
+        raise QueryError(f"{e} [{sql[:120]}]") from e
+    get_query_stats().record(sql, (time.perf_counter() - t0) * 1000, n, nbytes, _query_caller())
 
-def init_db():
-    queries = [
+# --- MIGRASI SKEMA (VERSIONED, SEKALI PER PROSES) ---
+def _seed_users(c):
+    res = c.execute("SELECT count(*) as cnt FROM users").fetchone()
+    if res and res[0] == 0:
+        c.execute("INSERT INTO users VALUES (?, ?, ?, ?)", ('admin', '123', 'admin', 'Administrator'))
+        c.execute("INSERT INTO users VALUES (?, ?, ?, ?)", ('siswa1', '123', 'student', 'Budi Santoso'))
+
+# (versi, keterangan, langkah): langkah berupa SQL atau fungsi(cursor). Jangan ubah migrasi lama, tambah versi baru.
+MIGRATIONS = [
+    (1, "Skema awal", [
         '''CREATE TABLE IF NOT EXISTS users (username TEXT PRIMARY KEY, password TEXT, role TEXT, name TEXT)''',
         '''CREATE TABLE IF NOT EXISTS materials (id INTEGER PRIMARY KEY AUTOINCREMENT, category TEXT, title TEXT, content TEXT, youtube_url TEXT, file_name TEXT, file_data BLOB, file_type TEXT)''',
         '''CREATE TABLE IF NOT EXISTS exams (id INTEGER PRIMARY KEY AUTOINCREMENT, category TEXT, sub_category TEXT, question TEXT, q_image BLOB, opt_a TEXT, opt_a_img BLOB, opt_b TEXT, opt_b_img BLOB, opt_c TEXT, opt_c_img BLOB, opt_d TEXT, opt_d_img BLOB, opt_e TEXT, opt_e_img BLOB, answer TEXT)''',
@@ -126,60 +367,301 @@ def init_db():
         '''CREATE TABLE IF NOT EXISTS exam_schedules (category TEXT PRIMARY KEY, open_time TEXT, close_time TEXT, duration_minutes INTEGER, max_attempts INTEGER)''',
         '''CREATE TABLE IF NOT EXISTS student_exam_attempts (student_name TEXT, category TEXT, start_time TEXT, PRIMARY KEY (student_name, category))''',
         '''CREATE TABLE IF NOT EXISTS student_answers_temp (student_name TEXT, category TEXT, question_id INTEGER, answer TEXT, is_doubtful INTEGER DEFAULT 0, PRIMARY KEY (student_name, category, question_id))''',
-        '''CREATE TABLE IF NOT EXISTS banners (id INTEGER PRIMARY KEY AUTOINCREMENT, type TEXT, content TEXT, image_data BLOB, created_at TEXT)'''
-    ]
-    conn = get_db_connection()
-    if conn:
-        try:
-            c = conn.cursor()
-            for q in queries:
-                try: c.execute(q.strip())
-                except: pass
-            conn.commit()
-            
+        '''CREATE TABLE IF NOT EXISTS banners (id INTEGER PRIMARY KEY AUTOINCREMENT, type TEXT, content TEXT, image_data BLOB, created_at TEXT)''',
+        _seed_users,
+    ]),
+    (2, "Index hot path", [
+        '''CREATE INDEX IF NOT EXISTS idx_exams_category ON exams (category)''',
+        '''CREATE INDEX IF NOT EXISTS idx_results_student ON results (student_name, category)''',
+        # student_answers_temp (student_name, category) sudah dilayani prefix PRIMARY KEY-nya
+    ]),
+    (3, "Hash file materi", ['''ALTER TABLE materials ADD COLUMN file_hash TEXT''']),
+    (4, "Lembar jawaban di results", ['''ALTER TABLE results ADD COLUMN answer_sheet TEXT''']),
+    (5, "Gambar soal content-addressed", [
+        '''CREATE TABLE IF NOT EXISTS exam_images (hash TEXT PRIMARY KEY, data BLOB, thumb BLOB, width INTEGER, height INTEGER, created_at TEXT)''',
+        '''ALTER TABLE exams ADD COLUMN q_image_ref TEXT''',
+        '''ALTER TABLE exams ADD COLUMN opt_a_img_ref TEXT''',
+        '''ALTER TABLE exams ADD COLUMN opt_b_img_ref TEXT''',
+        '''ALTER TABLE exams ADD COLUMN opt_c_img_ref TEXT''',
+        '''ALTER TABLE exams ADD COLUMN opt_d_img_ref TEXT''',
+        '''ALTER TABLE exams ADD COLUMN opt_e_img_ref TEXT''',
+    ]),
+    (6, "Pindahkan BLOB gambar lama ke exam_images", [lambda c: _backfill_exam_images(c)]),
+    (7, "Indeks FTS5 soal & materi", [
+        '''CREATE VIRTUAL TABLE IF NOT EXISTS exams_fts USING fts5(question, opt_a, opt_b, opt_c, opt_d, opt_e, content='exams', content_rowid='id', tokenize='unicode61 remove_diacritics 2')''',
+        '''CREATE TRIGGER IF NOT EXISTS exams_fts_ai AFTER INSERT ON exams BEGIN
+            INSERT INTO exams_fts (rowid, question, opt_a, opt_b, opt_c, opt_d, opt_e) VALUES (new.id, new.question, new.opt_a, new.opt_b, new.opt_c, new.opt_d, new.opt_e);
+        END''',
+        '''CREATE TRIGGER IF NOT EXISTS exams_fts_ad AFTER DELETE ON exams BEGIN
+            INSERT INTO exams_fts (exams_fts, rowid, question, opt_a, opt_b, opt_c, opt_d, opt_e) VALUES ('delete', old.id, old.question, old.opt_a, old.opt_b, old.opt_c, old.opt_d, old.opt_e);
+        END''',
+        '''CREATE TRIGGER IF NOT EXISTS exams_fts_au AFTER UPDATE OF question, opt_a, opt_b, opt_c, opt_d, opt_e ON exams BEGIN
+            INSERT INTO exams_fts (exams_fts, rowid, question, opt_a, opt_b, opt_c, opt_d, opt_e) VALUES ('delete', old.id, old.question, old.opt_a, old.opt_b, old.opt_c, old.opt_d, old.opt_e);
+            INSERT INTO exams_fts (rowid, question, opt_a, opt_b, opt_c, opt_d, opt_e) VALUES (new.id, new.question, new.opt_a, new.opt_b, new.opt_c, new.opt_d, new.opt_e);
+        END''',
+        '''INSERT INTO exams_fts (exams_fts) VALUES ('rebuild')''',
+        '''CREATE VIRTUAL TABLE IF NOT EXISTS materials_fts USING fts5(title, content, content='materials', content_rowid='id', tokenize='unicode61 remove_diacritics 2')''',
+        '''CREATE TRIGGER IF NOT EXISTS materials_fts_ai AFTER INSERT ON materials BEGIN
+            INSERT INTO materials_fts (rowid, title, content) VALUES (new.id, new.title, new.content);
+        END''',
+        '''CREATE TRIGGER IF NOT EXISTS materials_fts_ad AFTER DELETE ON materials BEGIN
+            INSERT INTO materials_fts (materials_fts, rowid, title, content) VALUES ('delete', old.id, old.title, old.content);
+        END''',
+        '''CREATE TRIGGER IF NOT EXISTS materials_fts_au AFTER UPDATE OF title, content ON materials BEGIN
+            INSERT INTO materials_fts (materials_fts, rowid, title, content) VALUES ('delete', old.id, old.title, old.content);
+            INSERT INTO materials_fts (rowid, title, content) VALUES (new.id, new.title, new.content);
+        END''',
+        '''INSERT INTO materials_fts (materials_fts) VALUES ('rebuild')''',
+    ]),
+    (8, "Versi konten untuk koherensi cache antar replika", [
+        '''CREATE TABLE IF NOT EXISTS content_versions (scope TEXT PRIMARY KEY, version INTEGER NOT NULL DEFAULT 0)''',
+        '''CREATE TRIGGER IF NOT EXISTS exams_cv_i AFTER INSERT ON exams BEGIN
+            INSERT INTO content_versions (scope, version) VALUES ('exams:' || new.category, 1) ON CONFLICT (scope) DO UPDATE SET version = version + 1;
+        END''',
+        '''CREATE TRIGGER IF NOT EXISTS exams_cv_u AFTER UPDATE ON exams BEGIN
+            INSERT INTO content_versions (scope, version) VALUES ('exams:' || old.category, 1) ON CONFLICT (scope) DO UPDATE SET version = version + 1;
+            INSERT INTO content_versions (scope, version) VALUES ('exams:' || new.category, 1) ON CONFLICT (scope) DO UPDATE SET version = version + 1;
+        END''',
+        '''CREATE TRIGGER IF NOT EXISTS exams_cv_d AFTER DELETE ON exams BEGIN
+            INSERT INTO content_versions (scope, version) VALUES ('exams:' || old.category, 1) ON CONFLICT (scope) DO UPDATE SET version = version + 1;
+        END''',
+        '''CREATE TRIGGER IF NOT EXISTS materials_cv_i AFTER INSERT ON materials BEGIN
+            INSERT INTO content_versions (scope, version) VALUES ('materials', 1) ON CONFLICT (scope) DO UPDATE SET version = version + 1;
+        END''',
+        '''CREATE TRIGGER IF NOT EXISTS materials_cv_u AFTER UPDATE ON materials BEGIN
+            INSERT INTO content_versions (scope, version) VALUES ('materials', 1) ON CONFLICT (scope) DO UPDATE SET version = version + 1;
+        END''',
+        '''CREATE TRIGGER IF NOT EXISTS materials_cv_d AFTER DELETE ON materials BEGIN
+            INSERT INTO content_versions (scope, version) VALUES ('materials', 1) ON CONFLICT (scope) DO UPDATE SET version = version + 1;
+        END''',
+        '''CREATE TRIGGER IF NOT EXISTS schedules_cv_i AFTER INSERT ON exam_schedules BEGIN
+            INSERT INTO content_versions (scope, version) VALUES ('schedule:' || new.category, 1) ON CONFLICT (scope) DO UPDATE SET version = version + 1;
+        END''',
+        '''CREATE TRIGGER IF NOT EXISTS schedules_cv_u AFTER UPDATE ON exam_schedules BEGIN
+            INSERT INTO content_versions (scope, version) VALUES ('schedule:' || old.category, 1) ON CONFLICT (scope) DO UPDATE SET version = version + 1;
+            INSERT INTO content_versions (scope, version) VALUES ('schedule:' || new.category, 1) ON CONFLICT (scope) DO UPDATE SET version = version + 1;
+        END''',
+        '''CREATE TRIGGER IF NOT EXISTS schedules_cv_d AFTER DELETE ON exam_schedules BEGIN
+            INSERT INTO content_versions (scope, version) VALUES ('schedule:' || old.category, 1) ON CONFLICT (scope) DO UPDATE SET version = version + 1;
+        END''',
+        '''CREATE TRIGGER IF NOT EXISTS banners_cv_i AFTER INSERT ON banners BEGIN
+            INSERT INTO content_versions (scope, version) VALUES ('banners', 1) ON CONFLICT (scope) DO UPDATE SET version = version + 1;
+        END''',
+        '''CREATE TRIGGER IF NOT EXISTS banners_cv_u AFTER UPDATE ON banners BEGIN
+            INSERT INTO content_versions (scope, version) VALUES ('banners', 1) ON CONFLICT (scope) DO UPDATE SET version = version + 1;
+        END''',
+        '''CREATE TRIGGER IF NOT EXISTS banners_cv_d AFTER DELETE ON banners BEGIN
+            INSERT INTO content_versions (scope, version) VALUES ('banners', 1) ON CONFLICT (scope) DO UPDATE SET version = version + 1;
+        END''',
+    ]),
+    (9, "Submit ujian idempoten per attempt", [
+        '''ALTER TABLE results ADD COLUMN attempt_key TEXT''',
+        '''CREATE UNIQUE INDEX IF NOT EXISTS idx_results_attempt ON results(attempt_key)''',
+        # Hasil yang tercatat langsung menutup attempt-nya di transaksi yang sama
+        '''CREATE TRIGGER IF NOT EXISTS results_attempt_done AFTER INSERT ON results WHEN new.attempt_key IS NOT NULL BEGIN
+            DELETE FROM student_exam_attempts WHERE student_name = new.student_name AND category = new.category;
+            DELETE FROM student_answers_temp WHERE student_name = new.student_name AND category = new.category;
+        END''',
+    ]),
+    (10, "Attempt baru mulai dengan jawaban sementara kosong", [
+        # Flush terlambat dari replika lain bisa menulis ulang jawaban attempt lama setelah dinilai;
+        # hanya berjalan jika baris attempt benar-benar dibuat (ON CONFLICT DO NOTHING tidak memicu trigger)
+        '''CREATE TRIGGER IF NOT EXISTS attempts_start_clean AFTER INSERT ON student_exam_attempts BEGIN
+            DELETE FROM student_answers_temp WHERE student_name = new.student_name AND category = new.category;
+        END''',
+    ]),
+]
+
+def run_migrations():
+    with db_connection() as conn:
+        c = conn.cursor()
+        c.execute("CREATE TABLE IF NOT EXISTS schema_version (version INTEGER PRIMARY KEY, description TEXT, applied_at TEXT)")
+        conn.commit()
+        current = c.execute("SELECT COALESCE(MAX(version), 0) FROM schema_version").fetchone()[0]
+        for version, desc, steps in MIGRATIONS:
+            if version <= current: continue
+            c.execute("BEGIN TRANSACTION")
             try:
-                res = c.execute("SELECT count(*) as cnt FROM users").fetchone()
-                if res and res[0] == 0:
-                    c.execute("INSERT INTO users VALUES (?, ?, ?, ?)", ('admin', '123', 'admin', 'Administrator'))
-                    c.execute("INSERT INTO users VALUES (?, ?, ?, ?)", ('siswa1', '123', 'student', 'Budi Santoso'))
-                    conn.commit()
-            except: pass
-        except Exception as e: st.error(f"DB Init Error: {e}")
+                for step in steps:
+                    if callable(step): step(c); continue
+                    try: c.execute(step)
+                    except Exception as e:
+                        # DB lama yang sudah punya kolom dari init_db sebelum ada versioning
+                        if "duplicate column" not in str(e).lower(): raise
+                c.execute("INSERT INTO schema_version (version, description, applied_at) VALUES (?, ?, ?)", (version, desc, get_wib_now().strftime("%Y-%m-%d %H:%M:%S")))
+                conn.commit()
+            except Exception as e:
+                conn.rollback()
+                # Replika lain sudah menjalankan migrasi yang sama
+                if "schema_version" in str(e): continue
+                raise
+        return c.execute("SELECT COALESCE(MAX(version), 0) FROM schema_version").fetchone()[0]
 
-init_db()
+@st.cache_resource
+def init_db(): return run_migrations()
 
 # --- DATABASE HELPERS ---
 
-@st.cache_data(ttl=600)
-def get_exams():
-    rows = run_query("SELECT * FROM exams")
+# --- IMAGE CACHE (LAZY LOAD, CONTENT-ADDRESSED LRU) ---
+EXAM_IMG_COLS = ('q_image', 'opt_a_img', 'opt_b_img', 'opt_c_img', 'opt_d_img', 'opt_e_img')
+IMAGE_CACHE_MAX_BYTES = 64 * 1024 * 1024
+
+class ImageLRU:
+    # Gambar disimpan sekali per hash isi; ref (hash exam_images atau "id:kolom" untuk BLOB lama) menunjuk ke hash
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._data = OrderedDict()
+        self._refs = {}
+        self._lock = threading.Lock()
+
+    def get(self, ref):
+        with self._lock:
+            h = self._refs.get(ref)
+            if h is None or h not in self._data: return None
+            self._data.move_to_end(h)
+            return self._data[h]
+
+    def put(self, ref, data):
+        h = hashlib.sha256(data).hexdigest()
+        with self._lock:
+            self._refs[ref] = h
+            if h in self._data:
+                self._data.move_to_end(h); return
+            self._data[h] = data; self.size += len(data)
+            while self.size > self.max_bytes and len(self._data) > 1:
+                _, old = self._data.popitem(last=False); self.size -= len(old)
+
+    def drop_exam(self, eid):
+        with self._lock:
+            for ref in [r for r in self._refs if r.split(':')[0] == str(eid)]: del self._refs[ref]
+
+@st.cache_resource
+def get_image_cache(): return ImageLRU(IMAGE_CACHE_MAX_BYTES)
+
+def get_exam_image(ref):
+    if not ref: return None
+    cache = get_image_cache()
+    data = cache.get(ref)
+    if data is None:
+        if ':' in ref:
+            eid, col = ref.split(':')
+            if col not in EXAM_IMG_COLS: return None
+            res = run_query(f"SELECT {col} AS img FROM exams WHERE id = ?", (int(eid),))
+        else: res = run_query("SELECT data AS img FROM exam_images WHERE hash = ?", (ref,))
+        data = res[0]['img'] if res else None
+        if data: cache.put(ref, data)
+    return data
+
+def get_exam_thumb(ref): return query_scalar("SELECT thumb FROM exam_images WHERE hash = ?", (ref,)) if ref and ':' not in ref else None
+
+class Question:
+    # Record soal read-only, dibagi semua sesi (lihat QuestionBank) sehingga tidak boleh diubah
+    __slots__ = ('id', 'category', 'sub_category', 'tanya', 'q_img', 'opsi', 'opsi_img', 'jawaban')
+    def __init__(self, *vals):
+        for k, v in zip(self.__slots__, vals): object.__setattr__(self, k, v)
+    def __setattr__(self, k, v): raise AttributeError("Question bersifat read-only")
+    def __repr__(self): return f"Question({self.id}, {self.category!r})"
+
+def _format_exams(rows):
     formatted = []
     if not rows: return []
     for r in rows:
+        ref = lambda c: f"{r['id']}:{c}" if r.get(f"ref_{c}") == 'legacy' else r.get(f"ref_{c}")
         raw_opsi = [r.get('opt_a'), r.get('opt_b'), r.get('opt_c'), r.get('opt_d'), r.get('opt_e')]
-        raw_imgs = [r.get('opt_a_img'), r.get('opt_b_img'), r.get('opt_c_img'), r.get('opt_d_img'), r.get('opt_e_img')]
+        raw_imgs = [ref('opt_a_img'), ref('opt_b_img'), ref('opt_c_img'), ref('opt_d_img'), ref('opt_e_img')]
         valid_opsi, valid_imgs = [], []
         for i in range(len(raw_opsi)):
             if raw_opsi[i] and str(raw_opsi[i]).strip() != "":
                 valid_opsi.append(raw_opsi[i]); valid_imgs.append(raw_imgs[i])
-        formatted.append({"id": r['id'], "category": r['category'], "sub_category": r.get('sub_category', 'Umum'), "tanya": r['question'], "q_img": r['q_image'], "opsi": valid_opsi, "opsi_img": valid_imgs, "jawaban": r['answer']})
+        formatted.append(Question(r['id'], r['category'], r.get('sub_category', 'Umum'), r['question'], ref('q_image'), tuple(valid_opsi), tuple(valid_imgs), r['answer']))
     return formatted
 
-@st.cache_data(ttl=600)
+# Katalog hanya teks + kunci + referensi gambar, BLOB diambil saat ditampilkan
+EXAM_CATALOG_COLS = "id, category, sub_category, question, answer, opt_a, opt_b, opt_c, opt_d, opt_e, " + ", ".join(f"COALESCE({c}_ref, CASE WHEN length({c}) > 0 THEN 'legacy' END) AS ref_{c}" for c in EXAM_IMG_COLS)
+
+# TTL panjang aman: perubahan dari replika lain dideteksi lewat content_versions (sync_content_versions)
+CATALOG_CACHE_TTL = 6 * 3600
+
+@st.cache_data(ttl=CATALOG_CACHE_TTL)
+def get_exam_categories():
+    res = run_query("SELECT DISTINCT category FROM exams ORDER BY category")
+    return [r['category'] for r in res] if res else []
+
+class QuestionBank:
+    # Bank soal per proses: tuple Question per kategori + index id -> posisi, dikembalikan apa adanya
+    # (cache_data meng-unpickle salinan baru setiap panggilan, biayanya ukuran bank x sesi x rerun)
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self._cats = {}    # kategori -> (waktu muat, tuple Question, {id: posisi})
+        self._locks = {}
+
+    def _entry(self, cat):
+        hit = self._cats.get(cat)
+        if hit and time.time() - hit[0] < self.ttl: return hit
+        with self._locks.setdefault(cat, threading.Lock()):
+            # Sesi lain yang menunggu lock memakai hasil muat yang sama, bukan query sendiri-sendiri
+            hit = self._cats.get(cat)
+            if hit and time.time() - hit[0] < self.ttl: return hit
+            qs = tuple(_format_exams(run_query(f"SELECT {EXAM_CATALOG_COLS} FROM exams WHERE category = ? ORDER BY id", (cat,))))
+            hit = self._cats[cat] = (time.time(), qs, {q.id: i for i, q in enumerate(qs)})
+            return hit
+
+    def category(self, cat): return self._entry(cat)[1]
+    def positions(self, cat): return self._entry(cat)[2]
+    def clear(self, *cats):
+        for cat in (cats or list(self._cats)): self._cats.pop(cat, None)
+
+@st.cache_resource
+def get_question_bank(): return QuestionBank(CATALOG_CACHE_TTL)
+
+def get_exams_by_category(cat): return get_question_bank().category(cat)
+
+def count_exams(): return query_scalar("SELECT count(*) FROM exams", default=0)
+
+# Daftar materi hanya metadata, isi file ada di file store lokal (alamat = hash isi)
+MATERIAL_META_COLS = "id, category, title, content, youtube_url, file_name, file_type, file_hash, length(file_data) > 0 AS has_file"
+FILE_STORE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".lulusin_store", "files")
+
+@st.cache_data(ttl=CATALOG_CACHE_TTL)
 def get_materials(): 
-    res = run_query("SELECT * FROM materials")
-    return pd.DataFrame(res) if res else pd.DataFrame()
+    return query_df(f"SELECT {MATERIAL_META_COLS} FROM materials")
 
-def clear_cache():
-    get_exams.clear()
-    get_materials.clear()
+def _file_store_path(h): return os.path.join(FILE_STORE_DIR, h[:2], h)
+
+def store_file(data):
+    h = hashlib.sha256(data).hexdigest()
+    path = _file_store_path(h)
+    if not os.path.exists(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp, "wb") as f: f.write(data)
+        os.replace(tmp, path)
+    return h
+
+def read_material_file(mid, h=None):
+    # Dipanggil saat tombol download diklik; DB hanya disentuh jika file belum ada di store lokal
+    if isinstance(h, str) and os.path.exists(_file_store_path(h)):
+        with open(_file_store_path(h), "rb") as f: return f.read()
+    res = run_query("SELECT file_data FROM materials WHERE id = ?", (mid,))
+    data = res[0]['file_data'] if res else None
+    if not data: return b""
+    nh = store_file(data)
+    if nh != h: run_query("UPDATE materials SET file_hash=? WHERE id=?", (nh, mid)); get_materials.clear()
+    return data
+
+def invalidate_exams(*cats):
+    # Hanya bank soal kategori yang berubah yang dibuang dari cache
+    for cat in set(cats):
+        if cat is not None: get_question_bank().clear(cat)
+    get_exam_categories.clear()
+
+def get_exam_category(eid): res=run_query("SELECT category FROM exams WHERE id = ?", (eid,)); return res[0]['category'] if res else None
 
 def get_user(u): 
     res = run_query("SELECT * FROM users WHERE username = ?", (u,))
     return res[0] if res else None
-def get_all_users(): 
-    res = run_query("SELECT username, role, name FROM users")
-    return pd.DataFrame(res) if res else pd.DataFrame()
+def count_users(): return query_scalar("SELECT count(*) FROM users", default=0)
 def add_user(u, p, r, n): run_query("INSERT INTO users VALUES (?, ?, ?, ?)", (u, p, r, n)); return True
 def update_user_data(u, n, r, np=None):
     if np: run_query("UPDATE users SET name=?, role=?, password=? WHERE username=?", (n, r, np, u))
@@ -187,65 +669,304 @@ def update_user_data(u, n, r, np=None):
 def delete_user(u): run_query("DELETE FROM users WHERE username=?", (u,))
 def update_user_password(u, np): run_query("UPDATE users SET password = ? WHERE username = ?", (np, u))
 
-def get_material_by_id(mid): res=run_query("SELECT * FROM materials WHERE id = ?", (mid,)); return res[0] if res else None
+def get_material_by_id(mid): res=run_query(f"SELECT {MATERIAL_META_COLS} FROM materials WHERE id = ?", (mid,)); return res[0] if res else None
 def add_material(cat, tit, con, yt, fn, fd, ft): 
-    run_query("INSERT INTO materials (category, title, content, youtube_url, file_name, file_data, file_type) VALUES (?,?,?,?,?,?,?)", (cat, tit, con, yt, fn, fd, ft))
-    clear_cache()
+    fh = store_file(fd) if fd else None
+    run_query("INSERT INTO materials (category, title, content, youtube_url, file_name, file_data, file_type, file_hash) VALUES (?,?,?,?,?,?,?,?)", (cat, tit, con, yt, fn, fd, ft, fh))
+    get_materials.clear()
 def update_material(mid, cat, tit, con, yt, fn, fd, ft):
-    if fd: run_query("UPDATE materials SET category=?, title=?, content=?, youtube_url=?, file_name=?, file_data=?, file_type=? WHERE id=?", (cat, tit, con, yt, fn, fd, ft, mid))
+    if fd: run_query("UPDATE materials SET category=?, title=?, content=?, youtube_url=?, file_name=?, file_data=?, file_type=?, file_hash=? WHERE id=?", (cat, tit, con, yt, fn, fd, ft, store_file(fd), mid))
     else: run_query("UPDATE materials SET category=?, title=?, content=?, youtube_url=? WHERE id=?", (cat, tit, con, yt, mid))
-    clear_cache()
+    get_materials.clear()
 def delete_material(mid): 
     run_query("DELETE FROM materials WHERE id=?", (mid,))
-    clear_cache()
+    get_materials.clear()
 
 def get_exam_by_id(eid): res=run_query("SELECT * FROM exams WHERE id = ?", (eid,)); return res[0] if res else None
 def add_exam(cat, sub, q, qi, oa, oai, ob, obi, oc, oci, od, odi, oe, oei, ans):
     od=None if not od or str(od).strip()=="" else od; oe=None if not oe or str(oe).strip()=="" else oe
-    run_query('''INSERT INTO exams (category, sub_category, question, q_image, opt_a, opt_a_img, opt_b, opt_b_img, opt_c, opt_c_img, opt_d, opt_d_img, opt_e, opt_e_img, answer) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)''', (cat, sub, q, qi, oa, oai, ob, obi, oc, oci, od, odi, oe, oei, ans))
-    clear_cache()
+    refs = ingest_exam_images(dict(zip(EXAM_IMG_COLS, (qi, oai, obi, oci, odi, oei))))
+    run_query('''INSERT INTO exams (category, sub_category, question, q_image_ref, opt_a, opt_a_img_ref, opt_b, opt_b_img_ref, opt_c, opt_c_img_ref, opt_d, opt_d_img_ref, opt_e, opt_e_img_ref, answer) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)''', (cat, sub, q, refs.get('q_image'), oa, refs.get('opt_a_img'), ob, refs.get('opt_b_img'), oc, refs.get('opt_c_img'), od, refs.get('opt_d_img'), oe, refs.get('opt_e_img'), ans))
+    invalidate_exams(cat)
 def update_exam_data(eid, cat, sub, q, qi, oa, oai, ob, obi, oc, oci, od, odi, oe, oei, ans):
+    # Gambar None = gambar lama dipertahankan
     od=None if not od or str(od).strip()=="" else od; oe=None if not oe or str(oe).strip()=="" else oe
-    run_query("""UPDATE exams SET category=?, sub_category=?, question=?, q_image=?, opt_a=?, opt_a_img=?, opt_b=?, opt_b_img=?, opt_c=?, opt_c_img=?, opt_d=?, opt_d_img=?, opt_e=?, opt_e_img=?, answer=? WHERE id=?""", (cat, sub, q, qi, oa, oai, ob, obi, oc, oci, od, odi, oe, oei, ans, eid))
-    clear_cache()
+    old_cat = get_exam_category(eid)
+    refs = ingest_exam_images(dict(zip(EXAM_IMG_COLS, (qi, oai, obi, oci, odi, oei))))
+    img_sets = "".join(f", {col}_ref=?, {col}=NULL" for col in refs)
+    run_query(f"UPDATE exams SET category=?, sub_category=?, question=?, opt_a=?, opt_b=?, opt_c=?, opt_d=?, opt_e=?, answer=?{img_sets} WHERE id=?", (cat, sub, q, oa, ob, oc, od, oe, ans) + tuple(refs.values()) + (eid,))
+    get_image_cache().drop_exam(eid)
+    invalidate_exams(old_cat, cat)
 def delete_exam_data(eid): 
+    cat = get_exam_category(eid)
     run_query("DELETE FROM exams WHERE id=?", (eid,))
-    clear_cache()
+    get_image_cache().drop_exam(eid)
+    invalidate_exams(cat)
 def delete_all_exams_in_category(cat): 
     run_query("DELETE FROM exams WHERE category=?", (cat,))
-    clear_cache()
+    invalidate_exams(cat)
 
-def set_schedule(cat, op, cl, dur, mx): run_query("REPLACE INTO exam_schedules (category, open_time, close_time, duration_minutes, max_attempts) VALUES (?, ?, ?, ?, ?)", (cat, op, cl, dur, mx))
-def get_schedule(cat): res=run_query("SELECT * FROM exam_schedules WHERE category = ?", (cat,)); return res[0] if res else None
+# --- IMAGE PROCESSING ---
+IMAGE_JPEG_QUALITY = 80
+IMAGE_UPLOAD_TYPES = ["png", "jpg", "jpeg", "webp", "gif", "bmp"]
 
-def start_student_exam(name, cat): 
-    run_query("INSERT INTO student_exam_attempts (student_name, category, start_time) VALUES (?, ?, ?)", (name, cat, get_wib_now().strftime("%Y-%m-%d %H:%M:%S")))
-def get_student_attempt(name, cat): res=run_query("SELECT start_time FROM student_exam_attempts WHERE student_name=? AND category=?", (name, cat)); return res[0] if res else None
-def get_all_student_attempts(name): return run_query("SELECT category, start_time FROM student_exam_attempts WHERE student_name=?", (name,))
-def clear_student_attempt(name, cat):
-    run_query("DELETE FROM student_exam_attempts WHERE student_name=? AND category=?", (name, cat))
-    run_query("DELETE FROM student_answers_temp WHERE student_name=? AND category=?", (name, cat))
+def image_mime(data): return "image/png" if data[:8] == b"\x89PNG\r\n\x1a\n" else "image/jpeg"
 
-def save_single_answer(name, cat, q_id, ans, doubt):
-    # Simpan jawaban tunggal
-    doubt_val = 1 if doubt else 0
-    run_query("REPLACE INTO student_answers_temp (student_name, category, question_id, answer, is_doubtful) VALUES (?, ?, ?, ?, ?)", (name, cat, q_id, ans, doubt_val))
-
-def save_bulk_answers(name, cat, answers_dict):
-    """Batch Save"""
-    conn = get_db_connection()
-    if not conn: return
-    c = conn.cursor()
+def make_rendition(data, max_width, quality=IMAGE_JPEG_QUALITY):
+    # Perkecil (tanpa upscale), buang metadata, kompres ulang. PNG dipertahankan jika ada transparansi.
+    img = ImageOps.exif_transpose(Image.open(io.BytesIO(data)))
+    if img.width > max_width: img = img.resize((max_width, max(1, round(img.height * max_width / img.width))), Image.LANCZOS)
+    out = io.BytesIO()
+    if img.mode in ("RGBA", "LA") or (img.mode == "P" and "transparency" in img.info):
+        img.save(out, "PNG", optimize=True)
+    else:
+        img.convert("RGB").save(out, "JPEG", quality=quality, optimize=True, progressive=True)
+    return out.getvalue(), img.size
+
+# --- INGEST GAMBAR SOAL (RENDITION + THUMBNAIL + DEDUP) ---
+QUESTION_IMG_MAX_WIDTH = 800   # ditampilkan 400 px, 2x untuk layar HiDPI
+OPTION_IMG_MAX_WIDTH = 200     # ditampilkan 100 px
+IMAGE_THUMB_WIDTH = 120
+
+def _img_max_width(col): return QUESTION_IMG_MAX_WIDTH if col == 'q_image' else OPTION_IMG_MAX_WIDTH
+
+def _ingest_image(c, data, max_width):
+    disp, (w, h) = make_rendition(data, max_width)
+    digest = hashlib.sha256(disp).hexdigest()
+    # Gambar identik di seluruh bank soal disimpan sekali
+    if not c.execute("SELECT 1 FROM exam_images WHERE hash = ?", (digest,)).fetchall():
+        thumb, _ = make_rendition(data, IMAGE_THUMB_WIDTH)
+        c.execute("INSERT INTO exam_images (hash, data, thumb, width, height, created_at) VALUES (?, ?, ?, ?, ?, ?) ON CONFLICT (hash) DO NOTHING", (digest, disp, thumb, w, h, get_wib_now().strftime("%Y-%m-%d %H:%M:%S")))
+    return digest
+
+def ingest_exam_images(images):
+    # {kolom: bytes upload} -> {kolom: hash}, kolom tanpa gambar dilewati
+    images = {col: data for col, data in images.items() if data}
+    if not images: return {}
+    with db_connection() as conn:
+        c = conn.cursor()
+        refs = {col: _ingest_image(c, data, _img_max_width(col)) for col, data in images.items()}
+        conn.commit()
+    return refs
+
+def _backfill_exam_images(c):
+    rows = c.execute("SELECT id FROM exams WHERE " + " OR ".join(f"length({col}) > 0" for col in EXAM_IMG_COLS)).fetchall()
+    for (eid,) in rows:
+        blobs = c.execute(f"SELECT {', '.join(EXAM_IMG_COLS)} FROM exams WHERE id = ?", (eid,)).fetchone()
+        refs = {}
+        for col, data in zip(EXAM_IMG_COLS, blobs):
+            if not data: continue
+            try: refs[col] = _ingest_image(c, data, _img_max_width(col))
+            except Exception as e: print(f"Backfill Gambar Gagal (soal {eid}, {col}): {e}")  # BLOB lama tetap dipakai
+        if refs: c.execute(f"UPDATE exams SET {', '.join(f'{col}_ref=?, {col}=NULL' for col in refs)} WHERE id=?", tuple(refs.values()) + (eid,))
+
+# --- IMPORT EXCEL (STREAMING + VALIDASI + 1 TRANSAKSI) ---
+IMPORT_COLS = ["Sub Kategori", "Pertanyaan", "Opsi A", "Opsi B", "Opsi C", "Opsi D", "Opsi E", "Jawaban Benar"]
+IMPORT_BATCH_SIZE = 200
+
+def _cell(v):
+    if v is None: return None
+    if isinstance(v, float) and v.is_integer(): v = int(v)
+    v = str(v).strip()
+    return v if v else None
+
+def parse_exam_workbook(f):
+    # Validasi semua baris dulu, kembalikan (rows, errors) tanpa menulis ke DB
+    wb = openpyxl.load_workbook(f, read_only=True, data_only=True)
+    rows, errors = [], []
     try:
+        it = wb.active.iter_rows(values_only=True)
+        header = [_cell(h) for h in (next(it, None) or ())]
+        missing = [c for c in IMPORT_COLS if c not in header]
+        if missing: return [], [(1, f"Kolom tidak ditemukan: {', '.join(missing)}")]
+        pos = [header.index(c) for c in IMPORT_COLS]
+        for n, raw in enumerate(it, start=2):
+            vals = [_cell(raw[i]) if i < len(raw) else None for i in pos]
+            if not any(vals): continue
+            sub, q, oa, ob, oc, od, oe, ans = vals
+            opts = {"A": oa, "B": ob, "C": oc, "D": od, "E": oe}
+            errs = []
+            if not q: errs.append("Pertanyaan kosong")
+            for k in "ABC":
+                if not opts[k]: errs.append(f"Opsi {k} kosong")
+            if not ans: errs.append("Jawaban Benar kosong")
+            elif ans not in opts.values():
+                # Kunci boleh berupa huruf opsi (A-E)
+                if opts.get(ans.upper()): ans = opts[ans.upper()]
+                else: errs.append(f"Jawaban Benar '{ans}' tidak cocok dengan opsi manapun")
+            if errs: errors.append((n, "; ".join(errs)))
+            else: rows.append((sub, q, oa, ob, oc, od, oe, ans))
+    finally: wb.close()
+    return rows, errors
+
+def import_exams_bulk(cat, rows):
+    with db_connection() as conn:
+        c = conn.cursor()
         c.execute("BEGIN TRANSACTION")
-        for qid, val in answers_dict.items():
-            doubt_val = 1 if val['doubt'] else 0
-            ans = val['answer']
-            if ans:
-                c.execute("REPLACE INTO student_answers_temp (student_name, category, question_id, answer, is_doubtful) VALUES (?, ?, ?, ?, ?)", (name, cat, qid, ans, doubt_val))
+        for i in range(0, len(rows), IMPORT_BATCH_SIZE):
+            c.executemany("INSERT INTO exams (category, sub_category, question, opt_a, opt_b, opt_c, opt_d, opt_e, answer) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", [(cat,) + r for r in rows[i:i + IMPORT_BATCH_SIZE]])
         conn.commit()
-    except Exception as e:
-        print(f"Save Error: {e}")
+    invalidate_exams(cat)
+    return len(rows)
+
+# --- JADWAL (CACHE IN-PROCESS) ---
+SCHEDULE_CACHE_TTL = 600
+SCHEDULE_COLS = ('category', 'open_time', 'close_time', 'duration_minutes', 'max_attempts')
+
+@st.cache_resource
+def get_schedule_cache(): return {}
+
+def _cache_schedule(cat, sch): get_schedule_cache()[cat] = (time.time(), sch)
+
+def set_schedule(cat, op, cl, dur, mx):
+    run_query("REPLACE INTO exam_schedules (category, open_time, close_time, duration_minutes, max_attempts) VALUES (?, ?, ?, ?, ?)", (cat, op, cl, dur, mx))
+    get_schedule_cache().pop(cat, None)
+def get_schedule(cat):
+    hit = get_schedule_cache().get(cat)
+    if hit and time.time() - hit[0] < SCHEDULE_CACHE_TTL: return hit[1]
+    res=run_query("SELECT * FROM exam_schedules WHERE category = ?", (cat,)); sch = res[0] if res else None
+    _cache_schedule(cat, sch)
+    return sch
+
+def get_student_exam_overview(name):
+    # Satu query: jadwal + attempt aktif + jumlah percobaan untuk semua kategori milik siswa
+    rows = run_query('''SELECT c.category, s.open_time, s.close_time, s.duration_minutes, s.max_attempts, a.start_time,
+            (SELECT count(*) FROM results r WHERE r.student_name = ? AND r.category = c.category) AS attempt_count
+        FROM (SELECT DISTINCT category FROM exams UNION SELECT category FROM student_exam_attempts WHERE student_name = ?) c
+        LEFT JOIN exam_schedules s ON s.category = c.category
+        LEFT JOIN student_exam_attempts a ON a.category = c.category AND a.student_name = ?''', (name, name, name))
+    overview = {}
+    for r in rows or []:
+        sch = {k: r[k] for k in SCHEDULE_COLS} if r['open_time'] else None
+        _cache_schedule(r['category'], sch)
+        overview[r['category']] = {'schedule': sch, 'start_time': r['start_time'], 'attempt_count': r['attempt_count']}
+    return overview
+
+def start_student_exam(name, cat):
+    # Idempoten (klik ganda / dua tab): attempt yang sudah berjalan dikembalikan apa adanya.
+    # start_time dikembalikan langsung dari write, tanpa menunggu replika / jeda
+    res = run_query("INSERT INTO student_exam_attempts (student_name, category, start_time) VALUES (?, ?, ?) ON CONFLICT (student_name, category) DO NOTHING RETURNING start_time", (name, cat, get_wib_now().strftime("%Y-%m-%d %H:%M:%S")))
+    if res: return res[0]['start_time']
+    att = get_student_attempt(name, cat)
+    return att['start_time'] if att else None
+def get_student_attempt(name, cat): res=run_query("SELECT start_time FROM student_exam_attempts WHERE student_name=? AND category=?", (name, cat)); return res[0] if res else None
+def attempt_key(name, cat, start): return f"{name}|{cat}|{start}"  # sama dengan ekspresi SQL di submit_student_exam
+
+def submit_student_exam(name, cat, sc, tot, dt, sheet, practice_key=None):
+    # Satu statement (satu round trip): kunci diturunkan dari baris attempt yang masih ada, unik per attempt_key,
+    # trigger results_attempt_done menghapus attempt + jawaban sementara secara atomik.
+    # Mode latihan tidak punya baris attempt: practice_key (dibuat per sesi) dipakai sebagai gantinya.
+    # Journal ditahan selama INSERT; jawaban antrean baru dibuang setelah INSERT berhasil (gagal -> tetap antre)
+    journal = get_answer_journal()
+    with journal.paused():
+        res = run_query(f"""INSERT INTO results (student_name, category, score, total_questions, date, answer_sheet, attempt_key)
+            SELECT ?, ?, ?, ?, ?, ?, k FROM (SELECT COALESCE((SELECT student_name || '|' || category || '|' || start_time FROM student_exam_attempts WHERE student_name=? AND category=?), ?) AS k) WHERE k IS NOT NULL
+            ON CONFLICT (attempt_key) DO NOTHING RETURNING {RESULT_COLS}""", (name, cat, sc, tot, dt, sheet, name, cat, practice_key))
+        journal.discard(name, cat)
+    # Kosong = attempt sudah dinilai (klik ganda, tab lain, sweeper): pakai hasil yang sudah ada
+    return res[0] if res else get_latest_student_result(name, cat)
+
+# --- ANTREAN MULAI UJIAN (ADMISSION CONTROL) ---
+EXAM_START_CONCURRENCY = 20
+ADMISSION_POLL_SECONDS = 2
+ADMISSION_TICKET_TTL = 15  # tiket yang tidak di-poll lagi (tab ditutup) dibuang
+
+class AdmissionQueue:
+    # Membatasi start ujian yang diproses bersamaan per proses; sisanya antre FIFO.
+    # Tidak ada thread server yang menunggu: klien yang antre mem-poll ulang lewat fragment
+    def __init__(self, limit):
+        self.limit = limit
+        self._lock = threading.Lock()
+        self._active = 0
+        self._waiting = OrderedDict()  # tiket -> waktu poll terakhir
+
+    def try_enter(self, ticket):
+        # (True, 0) jika mendapat slot, (False, posisi antrean) jika belum
+        now = time.time()
+        with self._lock:
+            for t, seen in list(self._waiting.items()):
+                if now - seen > ADMISSION_TICKET_TTL: del self._waiting[t]
+            self._waiting[ticket] = now  # tiket lama tetap di posisinya
+            pos = list(self._waiting).index(ticket)
+            if pos < self.limit - self._active:
+                del self._waiting[ticket]; self._active += 1
+                return True, 0
+            return False, pos + 1
+
+    def leave(self):
+        with self._lock: self._active -= 1
+
+    def cancel(self, ticket):
+        with self._lock: self._waiting.pop(ticket, None)
+
+@st.cache_resource
+def get_admission_queue(): return AdmissionQueue(st.secrets.get("exam", {}).get("start_concurrency", EXAM_START_CONCURRENCY))
+
+# --- ANSWER JOURNAL (WRITE-BEHIND) ---
+ANSWER_FLUSH_INTERVAL = 1.0
+ANSWER_UPSERT_CHUNK = 500  # 5 parameter per baris, di bawah batas variabel SQLite
+
+class AnswerJournal:
+    # Jawaban ditampung di RAM proses, perubahan berulang pada soal yang sama digabung,
+    # lalu ditulis batch oleh thread background setiap ANSWER_FLUSH_INTERVAL detik
+    def __init__(self, interval):
+        self.interval = interval
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._flush_lock = threading.RLock()
+        threading.Thread(target=self._run, name="answer-journal", daemon=True).start()
+
+    def put(self, name, cat, q_id, ans, doubt):
+        with self._lock: self._pending[(name, cat, q_id)] = (ans, 1 if doubt else 0)
+
+    @contextmanager
+    def paused(self):
+        # Selama blok ini flush background tidak menulis (dipakai sweeper saat mengklaim attempt)
+        with self._flush_lock: yield
+
+    def discard(self, name, cat):
+        # Dipanggil saat submit: jawaban ujian ini sudah ada di lembar jawaban. _flush_lock memastikan tidak ada
+        # flush yang sedang menulis ulang baris sementara setelah dihapus trigger submit
+        with self._flush_lock, self._lock:
+            for k in [k for k in self._pending if k[0] == name and k[1] == cat]: del self._pending[k]
+
+    def flush(self, name=None, cat=None):
+        # Tanpa argumen: flush semua. Dengan name+cat: flush sinkron satu ujian (dipakai sebelum penilaian)
+        with self._flush_lock:
+            with self._lock:
+                if name is None: batch, self._pending = self._pending, {}
+                else: batch = {k: self._pending.pop(k) for k in [k for k in self._pending if k[0] == name and k[1] == cat]}
+            if not batch: return True
+            try:
+                with db_connection() as conn:
+                    c = conn.cursor()
+                    c.execute("BEGIN TRANSACTION")
+                    rows = [k + v for k, v in batch.items()]
+                    # Upsert multi-baris: satu statement per potongan, bukan satu per jawaban
+                    for i in range(0, len(rows), ANSWER_UPSERT_CHUNK):
+                        part = rows[i:i + ANSWER_UPSERT_CHUNK]
+                        c.execute(f"""INSERT INTO student_answers_temp (student_name, category, question_id, answer, is_doubtful) VALUES {', '.join(['(?, ?, ?, ?, ?)'] * len(part))}
+                            ON CONFLICT (student_name, category, question_id) DO UPDATE SET answer = excluded.answer, is_doubtful = excluded.is_doubtful""", tuple(v for r in part for v in r))
+                    conn.commit()
+                return True
+            except Exception as e:
+                # Kembalikan ke antrean tanpa menimpa jawaban yang lebih baru
+                with self._lock:
+                    for k, v in batch.items(): self._pending.setdefault(k, v)
+                print(f"Journal Flush Error: {e}")
+                return False
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            self.flush()
+
+@st.cache_resource
+def get_answer_journal(): return AnswerJournal(ANSWER_FLUSH_INTERVAL)
+
+def save_single_answer(name, cat, q_id, ans, doubt):
+    # Simpan jawaban tunggal (antre di journal, tanpa round trip ke DB)
+    get_answer_journal().put(name, cat, q_id, ans, doubt)
 
 def get_temp_answers_full(name, cat):
     rows = run_query("SELECT question_id, answer, is_doubtful FROM student_answers_temp WHERE student_name=? AND category=?", (name, cat))
@@ -253,15 +974,281 @@ def get_temp_answers_full(name, cat):
     if rows:
         for r in rows: result[r['question_id']] = {'answer': r['answer'], 'doubt': bool(r['is_doubtful'])}
     return result
-def get_student_result_count(name, cat): res=run_query("SELECT count(*) as cnt FROM results WHERE student_name=? AND category=?", (name, cat)); return res[0]['cnt'] if res else 0
-def add_result(name, cat, sc, tot, dt): run_query("INSERT INTO results (student_name, category, score, total_questions, date) VALUES (?, ?, ?, ?, ?)", (name, cat, sc, tot, dt))
-def get_results(): 
-    res = run_query("SELECT * FROM results")
-    return pd.DataFrame(res) if res else pd.DataFrame()
-def get_latest_student_result(name, cat): res=run_query("SELECT * FROM results WHERE student_name=? AND category=? ORDER BY id DESC LIMIT 1", (name, cat)); return res[0] if res else None
-def add_banner(typ, cont, img): run_query("INSERT INTO banners (type, content, image_data, created_at) VALUES (?, ?, ?, ?)", (typ, cont, img, get_wib_now().strftime("%Y-%m-%d")))
-def get_banners(): return run_query("SELECT * FROM banners ORDER BY id DESC")
-def delete_banner(bid): run_query("DELETE FROM banners WHERE id=?", (bid,))
+def get_student_results(name):
+    return query_df("SELECT id, category, score, total_questions, date FROM results WHERE student_name=? ORDER BY id DESC", (name,))
+
+RESULT_COLS = "id, student_name, category, score, total_questions, date"
+RESULT_SORT_COLS = {"id": "ID", "date": "Tanggal", "student_name": "Nama", "category": "Kategori", "score": "Nilai"}
+
+def get_results_page(sort="id", desc=True, student=None, cat=None, after=None, limit=50):
+    # Keyset pagination: after = (nilai kolom sort, id) baris terakhir halaman sebelumnya
+    if sort not in RESULT_SORT_COLS: sort = "id"
+    where, params = [], []
+    if student: where.append("student_name LIKE ?"); params.append(f"%{student}%")
+    if cat: where.append("category = ?"); params.append(cat)
+    if after is not None:
+        where.append(f"({sort}, id) {'<' if desc else '>'} (?, ?)"); params.extend(after)
+    order = "DESC" if desc else "ASC"
+    q = f"SELECT {RESULT_COLS} FROM results {'WHERE ' + ' AND '.join(where) if where else ''} ORDER BY {sort} {order}, id {order} LIMIT ?"
+    rows = run_query(q, tuple(params) + (limit + 1,)) or []
+    nxt = (rows[limit - 1][sort], rows[limit - 1]['id']) if len(rows) > limit else None
+    return rows[:limit], nxt
+
+# --- DAFTAR ADMIN (KEYSET PAGINATION + PENCARIAN) ---
+ADMIN_PAGE_SIZE = 25
+
+def _keyset_page(q, where, params, key, after, limit):
+    # Ambil limit+1 baris untuk tahu ada halaman berikutnya; kursor = key baris terakhir
+    if after is not None: where.append(f"{key} > ?"); params.append(after)
+    rows = run_query(f"{q} {'WHERE ' + ' AND '.join(where) if where else ''} ORDER BY {key} LIMIT ?", tuple(params) + (limit + 1,)) or []
+    return rows[:limit], (rows[limit - 1][key] if len(rows) > limit else None)
+
+def get_exam_page(cat, sub=None, search=None, after=None, limit=ADMIN_PAGE_SIZE):
+    where, params = ["category = ?"], [cat]
+    if sub: where.append("sub_category = ?"); params.append(sub)
+    if fts_query(search): where.append("id IN (SELECT rowid FROM exams_fts WHERE exams_fts MATCH ?)"); params.append(fts_query(search))
+    return _keyset_page("SELECT id, sub_category, substr(question, 1, 80) AS question FROM exams", where, params, "id", after, limit)
+
+def get_exam_subcategories(cat): return [r['sub_category'] for r in run_query("SELECT DISTINCT sub_category FROM exams WHERE category = ? AND sub_category IS NOT NULL ORDER BY sub_category", (cat,)) or []]
+
+def get_material_page(cat=None, search=None, after=None, limit=ADMIN_PAGE_SIZE):
+    where, params = [], []
+    if cat: where.append("category = ?"); params.append(cat)
+    if fts_query(search): where.append("id IN (SELECT rowid FROM materials_fts WHERE materials_fts MATCH ?)"); params.append(fts_query(search))
+    return _keyset_page("SELECT id, category, title FROM materials", where, params, "id", after, limit)
+
+def get_material_categories(): return [r['category'] for r in run_query("SELECT DISTINCT category FROM materials ORDER BY category") or []]
+def count_materials(): return query_scalar("SELECT count(*) FROM materials", default=0)
+
+def get_user_page(role=None, search=None, after=None, limit=ADMIN_PAGE_SIZE):
+    where, params = [], []
+    if role: where.append("role = ?"); params.append(role)
+    if search: where.append("(username LIKE ? OR name LIKE ?)"); params.extend([f"%{search}%"] * 2)
+    return _keyset_page("SELECT username, role, name FROM users", where, params, "username", after, limit)
+
+# --- PENCARIAN FULL-TEXT (FTS5) ---
+SEARCH_LIMIT = 20
+
+def _fts_terms(text): return re.findall(r"\w+", text or "")
+
+def fts_query(text):
+    # Input bebas -> query FTS5 aman: tiap kata dikutip & prefix match, digabung AND
+    return " ".join(f'"{t}"*' for t in _fts_terms(text))
+
+def search_exams(text, cat=None, limit=SEARCH_LIMIT):
+    q = fts_query(text)
+    if not q: return []
+    # Bobot bm25: teks soal 2x lebih penting dari teks opsi
+    return run_query(f"""SELECT id, category, sub_category, snippet, rank FROM exams JOIN (
+        SELECT rowid AS fid, snippet(exams_fts, -1, '**', '**', '…', 12) AS snippet, bm25(exams_fts, 2.0, 1.0, 1.0, 1.0, 1.0, 1.0) AS rank
+        FROM exams_fts WHERE exams_fts MATCH ?) ON id = fid {'WHERE category = ?' if cat else ''} ORDER BY rank LIMIT ?""", (q,) + ((cat,) if cat else ()) + (limit,)) or []
+
+def search_materials(text, cat=None, limit=SEARCH_LIMIT):
+    q = fts_query(text)
+    if not q: return []
+    return run_query(f"""SELECT {MATERIAL_META_COLS}, snippet, rank FROM materials JOIN (
+        SELECT rowid AS fid, snippet(materials_fts, -1, '**', '**', '…', 16) AS snippet, bm25(materials_fts, 3.0, 1.0) AS rank
+        FROM materials_fts WHERE materials_fts MATCH ?) ON id = fid {'WHERE category = ?' if cat else ''} ORDER BY rank LIMIT ?""", (q,) + ((cat,) if cat else ()) + (limit,)) or []
+
+def find_duplicate_exams(question, exclude_id=None):
+    # Kandidat dari indeks (frasa utuh di kolom question), dipastikan sama setelah normalisasi
+    terms = _fts_terms(question)
+    if not terms: return []
+    rows = run_query("SELECT id, category, question FROM exams WHERE id IN (SELECT rowid FROM exams_fts WHERE exams_fts MATCH ?) LIMIT ?", ('question : "' + " ".join(terms) + '"', SEARCH_LIMIT)) or []
+    norm = lambda t: " ".join(_fts_terms(t)).lower()
+    return [r for r in rows if norm(r['question']) == norm(question) and r['id'] != exclude_id]
+
+# --- PENILAIAN & SWEEPER ATTEMPT KADALUARSA ---
+SWEEP_INTERVAL = 15
+SWEEP_BATCH_SIZE = 100
+# Sweeper menunggu sampai journal semua replika sempat flush jawaban terakhir sebelum mengklaim attempt
+SWEEP_GRACE_SECONDS = ANSWER_FLUSH_INTERVAL + 4
+
+def grade_answers(questions, answers):
+    # Skor (0-100) dan jumlah soal, dipakai oleh submit manual, auto-submit dan sweeper
+    sc = sum([1 for s in questions if answers.get(s.id, {}).get('answer') == s.jawaban])
+    return ((sc / len(questions)) * 100 if questions else 0), len(questions)
+
+def encode_answer_sheet(questions, answers):
+    # Format ringkas per attempt: {"q": [id soal], "a": "AC-B"} (huruf = posisi opsi, "-" = kosong)
+    letters = []
+    for s in questions:
+        ans = answers.get(s.id, {}).get('answer')
+        letters.append(chr(65 + s.opsi.index(ans)) if ans in s.opsi else "-")
+    return json.dumps({"q": [s.id for s in questions], "a": "".join(letters)}, separators=(",", ":"))
+
+def regrade_category(cat):
+    # Nilai ulang semua lembar jawaban kategori ini terhadap kunci terbaru (vektorisasi NumPy)
+    bank = get_question_bank()
+    questions = bank.category(cat)
+    if not questions: return 0
+    col = bank.positions(cat)
+    key = np.array([s.opsi.index(s.jawaban) if s.jawaban in s.opsi else -1 for s in questions], dtype=np.int16)
+    # Lembar jawaban dibaca streaming, hanya posisi (baris, soal, opsi) yang disimpan
+    ids, old, tots, seen, ri, ci, vi = [], [], [], [], [], [], []
+    for i, r in enumerate(query_iter("SELECT id, score, total_questions, answer_sheet FROM results WHERE category=? AND answer_sheet IS NOT NULL", (cat,))):
+        d = json.loads(r['answer_sheet'])
+        codes = np.frombuffer(d['a'].encode(), dtype=np.uint8).astype(np.int16) - 65
+        cols = np.array([col.get(q, -1) for q in d['q']], dtype=np.int64)
+        keep = (cols >= 0) & (codes >= 0)
+        # Penyebut = soal di lembar ini yang masih ada di bank; soal yang tidak pernah dilihat siswa tidak dihitung salah
+        ids.append(r['id']); old.append(r['score'] or 0); tots.append(r['total_questions']); seen.append(int((cols >= 0).sum()))
+        ri.append(np.full(keep.sum(), i)); ci.append(cols[keep]); vi.append(codes[keep])
+    if not ids: return 0
+    # Matriks attempt x soal, -2 = tidak dijawab / soal tidak ada di lembar
+    sheet = np.full((len(ids), len(questions)), -2, dtype=np.int16)
+    sheet[np.concatenate(ri), np.concatenate(ci)] = np.concatenate(vi)
+    seen = np.array(seen)
+    scores = np.divide((sheet == key).sum(axis=1) * 100, seen, out=np.zeros(len(ids)), where=seen > 0)
+    changed = np.flatnonzero((np.abs(scores - np.array(old, dtype=float)) > 1e-9) | (np.array(tots) != seen))
+    if not len(changed): return 0
+    with db_connection() as conn:
+        c = conn.cursor()
+        c.execute("BEGIN TRANSACTION")
+        c.executemany("UPDATE results SET score=?, total_questions=? WHERE id=?", [(float(scores[i]), int(seen[i]), ids[i]) for i in changed])
+        conn.commit()
+    return len(changed)
+
+def grade_expired_attempts(name=None, limit=SWEEP_BATCH_SIZE):
+    # Cari attempt yang waktunya habis (1 query), nilai per batch dalam 1 transaksi.
+    # Dengan name (sesi siswa sendiri): journal proses ini yang memegang jawabannya di-flush di bawah, tanpa masa tunggu
+    journal = get_answer_journal()
+    journal.flush()
+    now = get_wib_now()
+    cutoff = (now - timedelta(seconds=0 if name else SWEEP_GRACE_SECONDS)).strftime("%Y-%m-%d %H:%M:%S")
+    now = now.strftime("%Y-%m-%d %H:%M:%S")
+    q = """SELECT a.student_name, a.category, a.start_time FROM student_exam_attempts a JOIN exam_schedules s ON s.category = a.category
+        WHERE datetime(a.start_time, '+' || s.duration_minutes || ' minutes') <= ?"""
+    params = (cutoff,)
+    if name: q += " AND a.student_name = ?"; params += (name,)
+    expired = run_query(q + " LIMIT ?", params + (limit,))
+    if not expired: return 0
+    keys = [(r['student_name'], r['category']) for r in expired]
+    answers = {k: {} for k in keys}
+    rows = run_query(f"SELECT student_name, category, question_id, answer FROM student_answers_temp WHERE (student_name, category) IN (VALUES {', '.join(['(?, ?)'] * len(keys))})", tuple(v for k in keys for v in k))
+    for r in rows or []: answers[(r['student_name'], r['category'])][r['question_id']] = {'answer': r['answer']}
+    graded = []
+    # Journal ditahan sampai jawaban antrean milik attempt yang diklaim dibuang, agar tidak ditulis ulang
+    # ke student_answers_temp setelah trigger results_attempt_done membersihkannya (terbawa ke attempt berikutnya)
+    with journal.paused():
+        try:
+            with db_connection() as conn:
+                c = conn.cursor()
+                c.execute("BEGIN TRANSACTION")
+                for r in expired:
+                    # Klaim attempt dulu agar tidak dinilai dua kali (tab siswa / replika lain)
+                    c.execute("DELETE FROM student_exam_attempts WHERE student_name=? AND category=? AND start_time=? RETURNING student_name", (r['student_name'], r['category'], r['start_time']))
+                    if not c.fetchall(): continue
+                    k = (r['student_name'], r['category'])
+                    qs = get_exams_by_category(r['category'])
+                    val, tot = grade_answers(qs, answers[k])
+                    graded.append(k + (val, tot, now, encode_answer_sheet(qs, answers[k]), attempt_key(*k, r['start_time'])))
+                if graded:
+                    # Jawaban sementara dihapus trigger results_attempt_done
+                    c.executemany("INSERT INTO results (student_name, category, score, total_questions, date, answer_sheet, attempt_key) VALUES (?, ?, ?, ?, ?, ?, ?) ON CONFLICT (attempt_key) DO NOTHING", graded)
+                conn.commit()
+        except Exception as e:
+            print(f"Sweep Error: {e}"); return 0
+        for g in graded: journal.discard(*g[:2])
+    return len(graded)
+
+def _sweep_loop():
+    while True:
+        time.sleep(SWEEP_INTERVAL)
+        try:
+            while grade_expired_attempts() >= SWEEP_BATCH_SIZE: pass
+        except Exception as e: print(f"Sweep Error: {e}")
+
+@st.cache_resource
+def start_deadline_sweeper():
+    t = threading.Thread(target=_sweep_loop, name="deadline-sweeper", daemon=True); t.start()
+    return t
+
+# --- CACHE WARMER (BERDASARKAN exam_schedules) ---
+WARM_INTERVAL = 30          # < SCHEDULE_CACHE_TTL, cache jadwal kategori aktif tidak pernah kedaluwarsa
+WARM_LEAD_TIME = 300        # preload dimulai 5 menit sebelum open_time
+WARM_REFRESH_MARGIN = 120   # katalog dimuat ulang sebelum CATALOG_CACHE_TTL habis
+
+def warm_exam_caches(warmed):
+    # Satu putaran: semua jadwal -> cache jadwal; kategori yang akan / sedang dibuka -> katalog soal + gambar.
+    # warmed = {kategori: waktu muat terakhir oleh warmer}, dipertahankan antar putaran
+    now = get_wib_now()
+    active = []
+    for r in run_query("SELECT * FROM exam_schedules") or []:
+        cat = r['category']
+        _cache_schedule(cat, {k: r[k] for k in SCHEDULE_COLS})
+        od = datetime.strptime(r['open_time'], "%Y-%m-%d %H:%M:%S")
+        # Attempt yang dimulai tepat sebelum tutup masih berjalan selama durasi ujian
+        end = datetime.strptime(r['close_time'], "%Y-%m-%d %H:%M:%S") + timedelta(minutes=r['duration_minutes'] or 0)
+        if od - timedelta(seconds=WARM_LEAD_TIME) <= now <= end: active.append(cat)
+    for cat in active:
+        if time.time() - warmed.get(cat, 0) > CATALOG_CACHE_TTL - WARM_REFRESH_MARGIN:
+            # clear + muat ulang: pemanggil lain menunggu satu komputasi yang sama, bukan query sendiri-sendiri
+            get_question_bank().clear(cat); warmed[cat] = time.time()
+        for q in get_exams_by_category(cat):
+            for ref in (q.q_img, *q.opsi_img): get_exam_image(ref)
+    if active: get_exam_categories()
+    for cat in [c for c in warmed if c not in active]: del warmed[cat]
+    return active
+
+def _warm_loop():
+    warmed = {}
+    while True:
+        try: sync_content_versions(); warm_exam_caches(warmed)
+        except Exception as e: print(f"Warm Error: {e}")
+        time.sleep(WARM_INTERVAL)
+
+@st.cache_resource
+def start_cache_warmer():
+    t = threading.Thread(target=_warm_loop, name="cache-warmer", daemon=True); t.start()
+    return t
+
+# --- KOHERENSI CACHE ANTAR REPLIKA (content_versions) ---
+CONTENT_VERSION_CHECK_INTERVAL = 5
+
+@st.cache_resource
+def get_content_versions(): return {'seen': None, 'checked': 0.0, 'lock': threading.Lock()}
+
+def _invalidate_scope(scope):
+    kind, _, key = scope.partition(':')
+    if kind == 'exams':
+        get_question_bank().clear(key); get_exam_categories.clear()
+    elif kind == 'materials': get_materials.clear()
+    elif kind == 'schedule': get_schedule_cache().pop(key, None)
+    elif kind == 'banners': get_banner_state()['version'] += 1
+
+def sync_content_versions():
+    # Maksimal satu query per interval per proses; hanya cache milik scope yang versinya berubah yang dibuang.
+    # Versi dinaikkan oleh trigger di DB, jadi perubahan dari replika / proses mana pun terlihat
+    st_ = get_content_versions()
+    if time.time() - st_['checked'] < CONTENT_VERSION_CHECK_INTERVAL or not st_['lock'].acquire(blocking=False): return
+    try:
+        st_['checked'] = time.time()
+        cur = {r['scope']: r['version'] for r in run_query("SELECT scope, version FROM content_versions") or []}
+        seen = st_['seen']
+        if seen is not None:
+            for scope, v in cur.items():
+                if seen.get(scope) != v: _invalidate_scope(scope)
+            for scope in seen.keys() - cur.keys(): _invalidate_scope(scope)
+        st_['seen'] = cur
+    finally: st_['lock'].release()
+
+def get_latest_student_result(name, cat): res=run_query(f"SELECT {RESULT_COLS} FROM results WHERE student_name=? AND category=? ORDER BY id DESC LIMIT 1", (name, cat)); return res[0] if res else None
+# --- BANNER ---
+BANNER_MAX_WIDTH = 1200
+
+@st.cache_resource
+def get_banner_state(): return {'version': 0}
+
+def add_banner(typ, cont, img):
+    # Gambar diproses sekali saat upload: diperkecil + dikompres ulang
+    if img: img, _ = make_rendition(img, BANNER_MAX_WIDTH)
+    run_query("INSERT INTO banners (type, content, image_data, created_at) VALUES (?, ?, ?, ?)", (typ, cont, img, get_wib_now().strftime("%Y-%m-%d")))
+    get_banner_state()['version'] += 1
+def get_banners(): return run_query("SELECT id, type, created_at FROM banners ORDER BY id DESC")
+def delete_banner(bid):
+    run_query("DELETE FROM banners WHERE id=?", (bid,))
+    get_banner_state()['version'] += 1
 
 # ==========================================
 # 3. AUTH & SESSION
@@ -271,6 +1258,8 @@ if 'current_user' not in st.session_state: st.session_state['current_user'] = No
 if 'selected_exam_cat' not in st.session_state: st.session_state['selected_exam_cat'] = None
 if 'q_idx' not in st.session_state: st.session_state.q_idx = 0
 if 'local_answers' not in st.session_state: st.session_state['local_answers'] = {}
+if 'active_attempt' not in st.session_state: st.session_state['active_attempt'] = None
+if 'practice_keys' not in st.session_state: st.session_state['practice_keys'] = {}
 
 # Admin states
 for k in ['admin_active_category','edit_target_user','edit_q_id','edit_material_id']:
@@ -308,6 +1297,8 @@ def logout_button():
     if st.sidebar.button("🚪 Keluar"): 
         st.session_state['current_user'] = None
         st.session_state['local_answers'] = {} 
+        st.session_state['active_attempt'] = None
+        st.session_state['practice_keys'] = {}
         st.session_state.q_idx = 0
         st.session_state['selected_exam_cat'] = None
         st.query_params.clear(); st.rerun()
@@ -315,7 +1306,8 @@ def logout_button():
 # ==========================================
 # 4. KOMPONEN UI
 # ==========================================
-def display_timer_js(seconds_left):
+def display_timer_js(seconds_left, reload_jitter_ms=None):
+    if reload_jitter_ms is None: reload_jitter_ms = random.uniform(0, SWEEP_INTERVAL * 1000)
     html_code = f"""
     <div style="width:100%; background:#ff4b4b; color:white; text-align:center; padding:10px; border-radius:8px; font-size:18px; font-weight:bold; margin-bottom:10px; box-shadow: 0 2px 4px rgba(0,0,0,0.2);">
         ⏱️ <span id="timer">Loading...</span>
@@ -325,8 +1317,9 @@ def display_timer_js(seconds_left):
         var x = setInterval(function() {{
             if (timeLeft <= 0) {{
                 clearInterval(x);
-                document.getElementById("timer").innerHTML = "0m 0s";
-                window.parent.location.reload(); 
+                document.getElementById("timer").innerHTML = "Waktu habis, menyimpan...";
+                // Jeda acak agar reload tidak serentak, penilaian sudah dilakukan sweeper di server
+                setTimeout(function() {{ window.parent.location.reload(); }}, {int(reload_jitter_ms)});
             }} else {{
                 var m = Math.floor(timeLeft / 60);
                 var s = Math.floor(timeLeft % 60);
@@ -338,6 +1331,19 @@ def display_timer_js(seconds_left):
     """
     components.html(html_code, height=60)
 
+def keyset_pager(prefix, sig, fetch):
+    # Kursor tiap halaman disimpan di session state, kembali ke halaman 1 jika filter (sig) berubah
+    if st.session_state.get(f'{prefix}_sig')!=sig: st.session_state[f'{prefix}_sig']=sig; st.session_state[f'{prefix}_pages']=[None]
+    pages=st.session_state[f'{prefix}_pages']
+    rows,nxt=fetch(pages[-1])
+    return rows, pages, nxt
+
+def pager_controls(prefix, pages, nxt):
+    c1,c2,c3=st.columns([1,2,1])
+    if c1.button("⬅️ Prev", key=f"{prefix}_prev", disabled=len(pages)==1): pages.pop(); st.rerun()
+    c2.caption(f"Halaman {len(pages)}")
+    if c3.button("Next ➡️", key=f"{prefix}_next", disabled=nxt is None): pages.append(nxt); st.rerun()
+
 @st.dialog("🎉 Hasil Ujian", width="small")
 def show_result_popup(score, correct, total, category):
     st.balloons()
@@ -349,17 +1355,25 @@ def show_result_popup(score, correct, total, category):
         if "cat" in st.query_params: del st.query_params["cat"]
         st.rerun()
 
-def display_banner_carousel():
-    banners = get_banners()
-    if not banners: return
+@st.cache_data(ttl=CATALOG_CACHE_TTL, max_entries=4)
+def build_banner_html(version):
+    # Dibangun ulang hanya jika versi set banner berubah (add_banner / delete_banner)
+    banners = run_query("SELECT id, type, content, image_data FROM banners ORDER BY id DESC")
+    if not banners: return None
     slides = ""
     for idx, b in enumerate(banners):
         disp = "block" if idx == 0 else "none"
         if b['type']=='image' and b['image_data']:
-            b64 = base64.b64encode(b['image_data']).decode()
-            slides += f"""<div class="mySlides fade" style="display:{disp};"><img src="data:image/png;base64,{b64}" style="width:100%;height:300px;object-fit:cover;border-radius:10px;box-shadow:0 4px 6px rgba(0,0,0,0.1);"></div>"""
+            img = b['image_data']
+            if Image.open(io.BytesIO(img)).width > BANNER_MAX_WIDTH: img, _ = make_rendition(img, BANNER_MAX_WIDTH)  # banner lama yang belum diproses
+            b64 = base64.b64encode(img).decode()
+            slides += f"""<div class="mySlides fade" style="display:{disp};"><img src="data:{image_mime(img)};base64,{b64}" style="width:100%;height:300px;object-fit:cover;border-radius:10px;box-shadow:0 4px 6px rgba(0,0,0,0.1);"></div>"""
         else: slides += f"""<div class="mySlides fade" style="display:{disp};">{b['content']}</div>"""
-    components.html(f"""<style>.slideshow-container{{max-width:100%;position:relative;margin:auto;}}.fade{{animation-name:fade;animation-duration:1.5s;}}@keyframes fade{{from{{opacity:.4}}to{{opacity:1}}}}</style><div class="slideshow-container">{slides}</div><script>let si=0;show();function show(){{let i;let s=document.getElementsByClassName("mySlides");for(i=0;i<s.length;i++){{s[i].style.display="none";}}si++;if(si>s.length){{si=1}}s[si-1].style.display="block";setTimeout(show,5000);}}</script>""", height=310)
+    return f"""<style>.slideshow-container{{max-width:100%;position:relative;margin:auto;}}.fade{{animation-name:fade;animation-duration:1.5s;}}@keyframes fade{{from{{opacity:.4}}to{{opacity:1}}}}</style><div class="slideshow-container">{slides}</div><script>let si=0;show();function show(){{let i;let s=document.getElementsByClassName("mySlides");for(i=0;i<s.length;i++){{s[i].style.display="none";}}si++;if(si>s.length){{si=1}}s[si-1].style.display="block";setTimeout(show,5000);}}</script>"""
+
+def display_banner_carousel():
+    html = build_banner_html(get_banner_state()['version'])
+    if html: components.html(html, height=310)
 
 # ==========================================
 # 5. DASHBOARD ADMIN
@@ -367,12 +1381,12 @@ def display_banner_carousel():
 def admin_dashboard():
     st.title("👨‍🏫 Dashboard Admin")
     c1,c2,c3 = st.columns(3)
-    c1.metric("Total Pengguna", len(get_all_users()))
-    c2.metric("Total Soal", len(get_exams()))
-    c3.metric("Materi Aktif", len(get_materials()))
+    c1.metric("Total Pengguna", count_users())
+    c2.metric("Total Soal", count_exams())
+    c3.metric("Materi Aktif", count_materials())
     st.write("")
     
-    tab1, tab2, tab3, tab4, tab5 = st.tabs(["📚 Materi", "📝 Bank Soal", "📢 Info & Banner", "📊 Nilai", "👥 User"])
+    tab1, tab2, tab3, tab4, tab5, tab6 = st.tabs(["📚 Materi", "📝 Bank Soal", "📢 Info & Banner", "📊 Nilai", "👥 User", "⏱️ Performa"])
     
     # --- TAB 1: MATERI ---
     with tab1:
@@ -398,27 +1412,40 @@ def admin_dashboard():
                         fn,fd,ft = (f.name,f.getvalue(),f.type) if f else (None,None,None)
                         add_material(cat,tit,con,yt,fn,fd,ft); st.success("OK"); st.rerun()
             st.write("### Daftar Materi")
-            df = get_materials()
-            if not df.empty:
+            c1,c2=st.columns(2)
+            fs=c1.text_input("Cari Judul / Isi", key="mat_f_q"); fc=c2.selectbox("Kategori", ["--"]+get_material_categories(), key="mat_f_cat")
+            rows,pages,nxt=keyset_pager("mat", (fs,fc), lambda after: get_material_page(fc if fc!="--" else None, fs or None, after))
+            if rows:
                 c1,c2,c3,c4=st.columns([2,4,1,1]); c1.markdown("**Kategori**"); c2.markdown("**Judul**"); st.divider()
-                for i,r in df.iterrows():
+                for r in rows:
                     with st.container():
                         c1,c2,c3,c4=st.columns([2,4,1,1]); c1.write(r['category']); c2.write(r['title'])
                         if c3.button("✏️", key=f"em_{r['id']}"): st.session_state['edit_material_id']=r['id']; st.rerun()
                         if c4.button("🗑️", key=f"dm_{r['id']}"): delete_material(r['id']); st.rerun()
             else: st.info("Kosong")
+            pager_controls("mat", pages, nxt)
 
     # --- TAB 2: BANK SOAL ---
     with tab2:
         if not st.session_state['admin_active_category']:
-            ex_data = get_exams()
-            cats = sorted(list(set([e['category'] for e in ex_data]))) if ex_data else []
+            cats = get_exam_categories()
             c1,c2=st.columns(2); pc=c1.selectbox("Pilih Kategori", ["--"]+cats); ic=c2.text_input("Buat Baru")
             if st.button("Kelola"): st.session_state['admin_active_category']=ic if ic else (pc if pc!="--" else None); st.rerun()
+            st.divider()
+            fq=st.text_input("🔎 Cari Soal (semua kategori)", key="exq_search")
+            if fq:
+                hits=search_exams(fq)
+                for h in hits:
+                    c1,c2=st.columns([6,1]); c1.markdown(f"**{h['category']} · [{h['sub_category']}]** {h['snippet']}")
+                    if c2.button("✏️", key=f"sq_{h['id']}"): st.session_state['admin_active_category']=h['category']; st.session_state['edit_q_id']=h['id']; st.rerun()
+                if not hits: st.info("Tidak ditemukan")
         else:
             ac = st.session_state['admin_active_category']
-            c1,c2=st.columns([4,1]); c1.markdown(f"### 📂 {ac}"); 
-            if c2.button("⬅️ Kembali"): st.session_state['admin_active_category']=None; st.rerun()
+            c1,c2,c3=st.columns([3,1,1]); c1.markdown(f"### 📂 {ac}"); 
+            if c2.button("🔁 Nilai Ulang", help="Hitung ulang nilai semua attempt kategori ini dengan kunci terbaru"):
+                try: st.success(f"OK: {regrade_category(ac)} nilai diperbarui")
+                except Exception as e: st.error(f"Nilai Ulang Gagal: {e}")
+            if c3.button("⬅️ Kembali"): st.session_state['admin_active_category']=None; st.rerun()
             
             with st.expander("📅 Jadwal Ujian"):
                 sch=get_schedule(ac)
@@ -441,19 +1468,25 @@ def admin_dashboard():
                 if qd:
                     with st.form("eqf"):
                         sub=st.text_input("Sub", qd['sub_category']); q=st.text_area("Soal", qd['question'])
-                        qi=st.file_uploader("Gbr Soal")
+                        th=get_exam_thumb(qd['q_image_ref'])
+                        if th: st.image(th, caption="Gbr saat ini")
+                        qi=st.file_uploader("Gbr Soal (kosongkan jika tidak diganti)", type=IMAGE_UPLOAD_TYPES)
                         c1,c2=st.columns(2)
                         oa=c1.text_input("A", qd['opt_a']); ob=c1.text_input("B", qd['opt_b']); oc=c1.text_input("C", qd['opt_c'])
                         od=c2.text_input("D", qd['opt_d']); oe=c2.text_input("E", qd['opt_e']); ans=c2.text_input("Kunci", qd['answer'])
+                        with st.expander("Ganti Gbr Opsi"):
+                            cs=st.columns(5)
+                            oimgs=[cs[i].file_uploader(l, type=IMAGE_UPLOAD_TYPES, key=f"e{l}") for i,l in enumerate("ABCDE")]
                         if st.form_submit_button("Update"):
-                            nqi = qi.getvalue() if qi else qd['q_image']
-                            update_exam_data(qd['id'],ac,sub,q,nqi,oa,None,ob,None,oc,None,od,None,oe,None,ans); st.session_state['edit_q_id']=None; st.rerun()
+                            nqi = qi.getvalue() if qi else None
+                            via,vib,vic,vid,vie = [f.getvalue() if f else None for f in oimgs]
+                            update_exam_data(qd['id'],ac,sub,q,nqi,oa,via,ob,vib,oc,vic,od,vid,oe,vie,ans); st.session_state['edit_q_id']=None; st.rerun()
                         if st.form_submit_button("Batal"): st.session_state['edit_q_id']=None; st.rerun()
             else:
                 t1,t2=st.tabs(["Tambah Manual", "Import Excel"])
                 with t1:
                     with st.form("aqf", clear_on_submit=True):
-                        sub=st.text_input("Sub"); q=st.text_area("Soal"); qi=st.file_uploader("Gbr Soal")
+                        sub=st.text_input("Sub"); q=st.text_area("Soal"); qi=st.file_uploader("Gbr Soal", type=IMAGE_UPLOAD_TYPES)
                         n=st.radio("Jml Opsi",[3,4,5], horizontal=True)
                         st.caption("Isi teks opsi.")
                         c_ops1, c_ops2 = st.columns(2)
@@ -461,35 +1494,53 @@ def admin_dashboard():
                         with c_ops2: od=st.text_input("D"); oe=st.text_input("E"); ans=st.text_input("Kunci")
                         with st.expander("Gbr Opsi"):
                             c1,c2,c3,c4,c5=st.columns(5)
-                            ia=c1.file_uploader("A",key="ia"); ib=c2.file_uploader("B",key="ib"); ic=c3.file_uploader("C",key="ic")
-                            id=c4.file_uploader("D",key="id"); ie=c5.file_uploader("E",key="ie")
+                            ia=c1.file_uploader("A",key="ia",type=IMAGE_UPLOAD_TYPES); ib=c2.file_uploader("B",key="ib",type=IMAGE_UPLOAD_TYPES); ic=c3.file_uploader("C",key="ic",type=IMAGE_UPLOAD_TYPES)
+                            id=c4.file_uploader("D",key="id",type=IMAGE_UPLOAD_TYPES); ie=c5.file_uploader("E",key="ie",type=IMAGE_UPLOAD_TYPES)
                         if st.form_submit_button("Simpan"):
                             nqi=qi.getvalue() if qi else None
                             via=ia.getvalue() if ia else None; vib=ib.getvalue() if ib else None; vic=ic.getvalue() if ic else None
                             vid=id.getvalue() if id else None; vie=ie.getvalue() if ie else None
-                            add_exam(ac,sub,q,nqi,oa,via,ob,vib,oc,vic,od,vid,oe,vie,ans); st.success("OK"); st.rerun()
+                            args=(ac,sub,q,nqi,oa,via,ob,vib,oc,vic,od,vid,oe,vie,ans)
+                            # Cek duplikat sebelum simpan; jika ada, tunggu konfirmasi admin (form sudah dikosongkan, data disimpan di state)
+                            dups=find_duplicate_exams(q)
+                            if dups: st.session_state['exam_dup_pending']=(args, dups); st.rerun()
+                            add_exam(*args); st.success("OK"); st.rerun()
                 with t2:
                     uf=st.file_uploader("Excel"); 
+                    st.caption(f"Kolom: {', '.join(IMPORT_COLS)}")
                     if uf and st.button("Import"):
-                        try:
-                            df=pd.read_excel(uf)
-                            for _,r in df.iterrows():
-                                def c(v): return str(v).strip() if pd.notna(v) else None
-                                add_exam(ac,c(r["Sub Kategori"]),c(r["Pertanyaan"]),None,c(r["Opsi A"]),None,c(r["Opsi B"]),None,c(r["Opsi C"]),None,c(r["Opsi D"]),None,c(r["Opsi E"]),None,c(r["Jawaban Benar"]))
-                            st.success("OK"); st.rerun()
-                        except: st.error("Format Salah")
-
-            st.write("### Daftar Soal"); st.divider()
-            exams=[e for e in get_exams() if e['category']==ac]
+                        try: rows,errs=parse_exam_workbook(uf)
+                        except Exception as e: rows,errs=[],[(0, f"File tidak dapat dibaca: {e}")]
+                        if errs:
+                            st.error(f"Format Salah: {len(errs)} baris bermasalah, tidak ada soal yang diimport.")
+                            st.dataframe(pd.DataFrame(errs, columns=["Baris","Kesalahan"]), hide_index=True, use_container_width=True)
+                        elif not rows: st.warning("File kosong")
+                        else:
+                            try: n=import_exams_bulk(ac,rows); st.success(f"OK: {n} soal diimport"); st.rerun()
+                            except Exception as e: st.error(f"Import Gagal: {e}")
+
+            pend=st.session_state.get('exam_dup_pending')
+            if pend:
+                args,dups=pend
+                st.warning("⚠️ Soal serupa sudah ada: " + ", ".join(f"#{d['id']} ({d['category']})" for d in dups) + ". Tetap simpan?")
+                c1,c2=st.columns(2)
+                if c1.button("💾 Tetap Simpan", key="dup_save", type="primary"): add_exam(*args); st.session_state.pop('exam_dup_pending'); st.rerun()
+                if c2.button("Batal", key="dup_cancel"): st.session_state.pop('exam_dup_pending'); st.rerun()
+            st.write("### Daftar Soal")
+            c1,c2=st.columns(2)
+            fs=c1.text_input("Cari Soal", key="exq_f_q"); fsub=c2.selectbox("Sub Kategori", ["--"]+get_exam_subcategories(ac), key="exq_f_sub")
+            st.divider()
+            exams,pages,nxt=keyset_pager("exq", (ac,fs,fsub), lambda after: get_exam_page(ac, fsub if fsub!="--" else None, fs or None, after))
             if exams:
                 for ex in exams:
                     with st.container():
                         c_row1, c_row2, c_row3 = st.columns([6, 1, 1])
-                        c_row1.markdown(f"**[{ex['sub_category']}]** {ex['tanya'][:80]}...")
+                        c_row1.markdown(f"**[{ex['sub_category']}]** {ex['question']}...")
                         if c_row2.button("✏️", key=f"eq_{ex['id']}"): st.session_state['edit_q_id']=ex['id']; st.rerun()
                         if c_row3.button("🗑️", key=f"dq_{ex['id']}"): delete_exam_data(ex['id']); st.rerun()
                         st.markdown("---")
             else: st.info("Kosong")
+            pager_controls("exq", pages, nxt)
 
     with tab3:
         t1,t2=st.tabs(["Editor", "Preview"]); 
@@ -498,18 +1549,23 @@ def admin_dashboard():
             if st.button("Publish"): 
                 h=f"""<div style="width:100%;height:300px;background:{bg};color:white;display:flex;align-items:center;justify-content:center;border-radius:10px;">{txt}</div>"""
                 add_banner('text',h,None); st.rerun()
+            st.divider()
+            bi=st.file_uploader("Gambar Banner", type=IMAGE_UPLOAD_TYPES, key="banner_img")
+            if bi and st.button("Publish Gambar"): add_banner('image',None,bi.getvalue()); st.rerun()
         with t2:
             bans=get_banners()
             for b in bans:
-                c1,c2=st.columns([4,1]); c1.write(f"ID: {b['id']}"); 
+                c1,c2=st.columns([4,1]); c1.write(f"ID: {b['id']} · {b['type']} · {b['created_at']}"); 
                 if c2.button("Hapus", key=f"db_{b['id']}"): delete_banner(b['id']); st.rerun()
 
     with tab4:
-        df = get_results()
-        if not df.empty:
-            st.dataframe(df, use_container_width=True)
-        else:
-            st.info("Kosong")
+        c1,c2,c3,c4=st.columns([2,2,2,1])
+        fs=c1.text_input("Cari Nama", key="res_f_name"); fc=c2.selectbox("Kategori", ["--"]+get_exam_categories(), key="res_f_cat")
+        so=c3.selectbox("Urutkan", list(RESULT_SORT_COLS), format_func=RESULT_SORT_COLS.get, key="res_sort"); de=c4.toggle("Desc", True, key="res_desc")
+        rows,pages,nxt=keyset_pager("res", (fs,fc,so,de), lambda after: get_results_page(so,de,fs or None,fc if fc!="--" else None,after))
+        if rows: st.dataframe(pd.DataFrame(rows), use_container_width=True, hide_index=True)
+        else: st.info("Kosong")
+        pager_controls("res", pages, nxt)
 
     # --- TAB 5: KELOLA USER ---
     with tab5:
@@ -519,12 +1575,14 @@ def admin_dashboard():
                 if st.form_submit_button("Simpan"): add_user(u,p,r,n); st.rerun()
         
         st.write("### Daftar User")
-        dfu = get_all_users()
-        if not dfu.empty:
+        c1,c2=st.columns(2)
+        fs=c1.text_input("Cari Username / Nama", key="usr_f_q"); fr=c2.selectbox("Role", ["--","student","admin"], key="usr_f_role")
+        rows,pages,nxt=keyset_pager("usr", (fs,fr), lambda after: get_user_page(fr if fr!="--" else None, fs or None, after))
+        if rows:
             c1,c2,c3,c4,c5 = st.columns([2,3,2,1,1]); c1.markdown("**User**"); c2.markdown("**Nama**"); c3.markdown("**Role**")
             st.divider()
             
-            for i, row in dfu.iterrows():
+            for row in rows:
                 with st.container():
                     c1,c2,c3,c4,c5 = st.columns([2,3,2,1,1])
                     c1.write(row['username'])
@@ -534,6 +1592,8 @@ def admin_dashboard():
                     if c5.button("🗑️", key=f"du_{row['username']}"): 
                         if row['username'] != st.session_state['current_user']['username']: delete_user(row['username']); st.rerun()
                     st.markdown("---")
+        else: st.info("Kosong")
+        pager_controls("usr", pages, nxt)
         
         if st.session_state['edit_target_user']:
             ud = get_user(st.session_state['edit_target_user'])
@@ -546,63 +1606,194 @@ def admin_dashboard():
                     if st.form_submit_button("Simpan"): update_user_data(ud['username'],en,er,ep if ep else None); st.session_state['edit_target_user']=None; st.rerun()
                     if st.form_submit_button("Batal"): st.session_state['edit_target_user']=None; st.rerun()
 
+    # --- TAB 6: PERFORMA QUERY ---
+    with tab6:
+        qs = get_query_stats()
+        rr = qs.rerun_table()
+        c1,c2,c3,c4 = st.columns(4)
+        c1.metric("Rerun Tercatat", len(rr))
+        if not rr.empty:
+            c2.metric("Query / Rerun (p50 / p95)", f"{rr['queries'].median():.0f} / {rr['queries'].quantile(.95):.0f}")
+            c3.metric("DB ms / Rerun (p95)", f"{rr['db_ms'].quantile(.95):.0f}")
+            c4.metric("Rerun ms (p95)", f"{rr['total_ms'].quantile(.95):.0f}")
+        st.write("### Per Query")
+        qt = qs.query_table()
+        if not qt.empty: st.dataframe(qt, use_container_width=True, hide_index=True)
+        else: st.info("Kosong")
+        st.write(f"### Query Lambat (≥ {SLOW_QUERY_MS} ms / error)")
+        sl = list(qs.slow_log)
+        if sl: st.dataframe(pd.DataFrame(sl[::-1]), use_container_width=True, hide_index=True)
+        else: st.info("Kosong")
+        c1,c2 = st.columns(2)
+        c1.download_button("⬇️ Export JSON", qs.export_json, file_name=f"query_stats_{get_wib_now().strftime('%Y%m%d_%H%M%S')}.json", mime="application/json", on_click="ignore")
+        if c2.button("Reset Statistik"): qs.reset(); st.rerun()
+
 # ==========================================
 # 6. STUDENT DASHBOARD (LOGIKA FINAL)
 # ==========================================
+@st.fragment
+def exam_view(user, pcat):
+    # Jawab, ragu-ragu & navigasi hanya me-rerun fragment ini (soal + navigator), bukan seluruh dashboard
+    # Deadline dicek di setiap rerun fragment; lewat batas -> rerun penuh agar auto-submit di student_dashboard jalan
+    att = st.session_state['active_attempt']
+    sch = get_schedule(pcat) if att and att[0] == pcat else None
+    end_time = datetime.strptime(att[1], "%Y-%m-%d %H:%M:%S") + timedelta(minutes=sch['duration_minutes']) if sch else None
+    if end_time and get_wib_now() >= end_time: st.rerun(scope="app")
+
+    with get_query_stats().rerun("student_exam"):
+        raw = get_exams_by_category(pcat)
+
+        # --- LOAD INITIAL DB DATA TO LOCAL STATE (ONCE) ---
+        if pcat not in st.session_state['local_answers']:
+            st.session_state['local_answers'][pcat] = get_temp_answers_full(user['name'], pcat)
+
+        local_data = st.session_state['local_answers'][pcat]
+
+        # --- UPDATE RAM FUNCTION (NO DB CALL) ---
+        def update_ram(qid):
+            # Callback ini hanya update Session State
+            ans = st.session_state.get(f"rad_{qid}")
+            dbt = st.session_state.get(f"chk_{qid}")
+            if ans and not (end_time and get_wib_now() >= end_time):
+                local_data[qid] = {'answer': ans, 'doubt': dbt}
+                save_single_answer(user['name'], pcat, qid, ans, dbt)
+
+        # --- NAVIGASI ---
+        def go_jump(idx): 
+            # Jawaban sudah masuk journal saat dipilih, cukup pindah soal
+            st.session_state.q_idx = idx
+
+        # Navigator di kolom kanan: st.sidebar tidak bisa ditulis dari dalam fragment
+        c_q, c_nav = st.columns([3, 1])
+
+        # --- NAVIGATION (READ RAM) ---
+        def go_pick():
+            # Klik ulang pill aktif mengosongkan pilihan (None), soal tetap
+            if st.session_state['nav_pick'] is not None: st.session_state.q_idx = st.session_state['nav_pick']
+
+        with c_nav:
+            st.write("### 🧭 Navigasi Soal")
+            # Satu widget untuk semua soal, label dibangun dari string status ringkas
+            status = nav_status(raw, local_data)
+            st.caption(f"✅ {status.count('a')} · ⚠️ {status.count('r')} · ⬜ {status.count('-')}")
+            st.session_state['nav_pick'] = st.session_state.q_idx
+            st.pills("Soal", range(len(status)), format_func=lambda i: NAV_LABELS[status[i]].format(i + 1), key="nav_pick", on_change=go_pick, label_visibility="collapsed")
+
+        with c_q:
+            # --- DISPLAY CURRENT QUESTION ---
+            current_q = raw[st.session_state.q_idx]
+            q_id = current_q.id
+
+            saved_val = local_data.get(q_id, {})
+            idx_sel = current_q.opsi.index(saved_val.get('answer')) if saved_val.get('answer') in current_q.opsi else None
+
+            st.markdown(f"#### Soal No. {st.session_state.q_idx + 1}")
+            st.markdown(f"<div class='question-container'>{current_q.tanya}</div>", unsafe_allow_html=True)
+            q_img = get_exam_image(current_q.q_img)
+            if q_img: st.image(q_img, width=400)
+
+            if len(current_q.opsi) > 0:
+                c_ops = st.columns(len(current_q.opsi))
+                for i, c in enumerate(c_ops):
+                    with c:
+                        o_img = get_exam_image(current_q.opsi_img[i])
+                        if o_img: st.image(o_img, width=100)
+
+            # --- INPUTS (ON CHANGE -> UPDATE RAM ONLY) ---
+            st.radio("Pilih Jawaban:", current_q.opsi, index=idx_sel, key=f"rad_{q_id}", on_change=update_ram, args=(q_id,))
+            st.checkbox("🚩 Ragu-ragu", value=saved_val.get('doubt', False), key=f"chk_{q_id}", on_change=update_ram, args=(q_id,))
+
+            st.divider()
+
+            # --- BUTTONS ---
+            c_prev, c_dbt, c_next = st.columns([1, 2, 1])
+
+            c_prev.button("⬅️ Sebelumnya", disabled=(st.session_state.q_idx == 0), on_click=go_jump, args=(st.session_state.q_idx - 1,))
+
+            if st.session_state.q_idx < len(raw) - 1:
+                c_next.button("Selanjutnya ➡️", type="primary", on_click=go_jump, args=(st.session_state.q_idx + 1,))
+            else:
+                if c_next.button("✅ Kirim Selesai", type="primary"):
+                    # Hitung Nilai dari RAM (Data Paling Update), lembar jawaban ikut tersimpan di baris hasil
+                    final_answers = local_data
+                    val, tot = grade_answers(raw, final_answers)
+                    st.session_state['last_result'] = submit_student_exam(user['name'], pcat, val, tot, get_wib_now().strftime("%Y-%m-%d %H:%M:%S"), encode_answer_sheet(raw, final_answers), st.session_state['practice_keys'].get(pcat))
+                    st.session_state['practice_keys'].pop(pcat, None)
+                    st.session_state['active_attempt'] = None
+                    st.session_state['local_answers'].pop(pcat, None)
+
+                    st.session_state['selected_exam_cat'] = None
+                    st.session_state.q_idx = 0
+                    st.query_params["exam_done"]="true"; st.query_params["cat"]=pcat; st.query_params["u_id"]=user['username']
+                    st.rerun()
+
+@st.fragment(run_every=ADMISSION_POLL_SECONDS)
+def exam_start_queue(user, pcat):
+    # Saat jadwal dibuka semua siswa klik MULAI bersamaan: yang belum dapat slot menunggu di sini
+    if st.session_state.get('start_pending') != pcat: return
+    q = get_admission_queue()
+    ok, pos = q.try_enter((user['name'], pcat))
+    if not ok:
+        st.info(f"⏳ Dalam antrean mulai ujian (posisi {pos}). Ujian dimulai otomatis, jangan muat ulang halaman.")
+        return
+    try: start = start_student_exam(user['name'], pcat)
+    finally: q.leave()
+    st.session_state.pop('start_pending', None)
+    if start: st.session_state['active_attempt'] = (pcat, start)
+    st.rerun()
+
+STUDENT_SECTIONS = ["📚 Materi", "📝 Ujian", "🏆 Nilai"]
+NAV_LABELS = {'-': "{}", 'a': "✅ {}", 'r': "⚠️ {}"}
+
+def nav_status(raw, local_data):
+    # Satu karakter per soal: '-' kosong, 'a' dijawab, 'r' ragu-ragu
+    return "".join('r' if d.get('doubt') else 'a' if d.get('answer') else '-' for d in (local_data.get(q.id, {}) for q in raw))
+
+def material_card(r, title, snippet=None):
+    with st.expander(title):
+        if snippet: st.caption(snippet)
+        st.write(r['content'])
+        if r['youtube_url']: st.video(r['youtube_url'])
+        if r['has_file']:
+            # Data diambil hanya saat diklik (deferred), tidak ikut setiap rerun
+            st.download_button(f"⬇️ Download {r['file_name']}", lambda mid=r['id'], h=r['file_hash']: read_material_file(mid, h), file_name=r['file_name'], mime=r['file_type'] if pd.notna(r['file_type']) else None, on_click="ignore", key=f"dl_{r['id']}")
+
 def student_dashboard():
     user = st.session_state['current_user']
     
     # [POP-UP CHECK DI AWAL]
     if "exam_done" in st.query_params:
         tc = st.query_params.get("cat")
-        lr = get_latest_student_result(user['name'], tc)
+        # Hasil submit manual dibawa dari RETURNING, query hanya untuk auto-submit / reload halaman
+        lr = st.session_state.pop('last_result', None)
+        if not lr or lr['category'] != tc: lr = get_latest_student_result(user['name'], tc)
         if lr:
             show_result_popup(lr['score'], (lr['score']/100)*lr['total_questions'] if lr['total_questions']>0 else 0, lr['total_questions'], tc)
 
-    all_qs = get_exams() # Cache
-    atts = get_all_student_attempts(user['name'])
+    overview = get_student_exam_overview(user['name'])
     
     # [TIMER LOGIC]
-    trigger_submit_final = False
     target_cat_final = None
     
-    for att in atts:
-        cat = att['category']; sch = get_schedule(cat)
-        if sch:
-            s_dt = datetime.strptime(att['start_time'], "%Y-%m-%d %H:%M:%S")
+    for cat, ov in overview.items():
+        sch = ov['schedule']
+        if sch and ov['start_time']:
+            s_dt = datetime.strptime(ov['start_time'], "%Y-%m-%d %H:%M:%S")
             dead = s_dt + timedelta(minutes=sch['duration_minutes'])
             if (dead - get_wib_now()).total_seconds() <= 0:
-                trigger_submit_final = True
                 target_cat_final = cat
 
+    # Attempt yang sedang dikerjakan sesi ini sudah dinilai sweeper di server (baris attempt hilang)
+    tracked = st.session_state['active_attempt']
+    if tracked and overview.get(tracked[0], {}).get('start_time') != tracked[1]:
+        target_cat_final = tracked[0]
+
     # [SUBMIT OTOMATIS (WAKTU HABIS)]
-    if trigger_submit_final and target_cat_final:
-        # [FIX] Nilai 0 -> Ambil FORCE dari RAM
-        
-        # 1. Update State Current Question (Widget to RAM)
-        if 'selected_exam_cat' in st.session_state:
-            # Karena widget mungkin sudah hilang, kita hanya bisa mengandalkan local_answers
-            pass
-            
-        # 2. Merge DB dan RAM
-        final_answers = get_temp_answers_full(user['name'], target_cat_final) # DB base
-        
-        # Timpa dengan RAM (jika ada yg lebih baru)
-        if target_cat_final in st.session_state['local_answers']:
-            ram_data = st.session_state['local_answers'][target_cat_final]
-            for qid, val in ram_data.items():
-                final_answers[qid] = val
-        
-        # 3. Save Final State
-        save_bulk_answers(user['name'], target_cat_final, final_answers)
-        
-        # 4. Grading
-        raw=[e for e in all_qs if e['category']==target_cat_final]
-        sc=sum([1 for s in raw if final_answers.get(s['id'],{}).get('answer') == s['jawaban']])
-        val=(sc/len(raw))*100 if raw else 0
-        
-        add_result(user['name'], target_cat_final, val, len(raw), get_wib_now().strftime("%Y-%m-%d %H:%M:%S"))
-        clear_student_attempt(user['name'], target_cat_final)
+    if target_cat_final:
+        # Penilaian memakai jalur sweeper (jawaban RAM sudah ada di journal), client hanya ambil hasil
+        if overview.get(target_cat_final, {}).get('start_time'): grade_expired_attempts(user['name'])
+        st.session_state['active_attempt'] = None
+        st.session_state['local_answers'].pop(target_cat_final, None)
         
         st.session_state['selected_exam_cat'] = None
         st.session_state.q_idx = 0
@@ -610,25 +1801,27 @@ def student_dashboard():
         st.rerun()
 
     st.markdown(f"### 👋 Halo, {user['name']}"); display_banner_carousel(); st.write("")
-    tab1, tab2, tab3 = st.tabs(["📚 Materi", "📝 Ujian", "🏆 Nilai"])
+    # Hanya bagian yang dipilih yang dirender; st.tabs merender ketiganya di setiap rerun
+    section = st.radio("Menu", STUDENT_SECTIONS, index=1 if st.session_state['selected_exam_cat'] else 0, key="student_section", horizontal=True, label_visibility="collapsed")
 
     # TAB MATERI
-    with tab1:
-        df = get_materials()
-        if not df.empty:
-            cat = st.selectbox("📂 Filter Kategori Materi", sorted(df['category'].unique()))
-            st.divider()
-            for _, r in df[df['category']==cat].iterrows():
-                with st.expander(f"📄 {r['title']}"):
-                    st.write(r['content'])
-                    if r['youtube_url']: st.video(r['youtube_url'])
-                    if r['file_data']:
-                        st.download_button(f"⬇️ Download {r['file_name']}", r['file_data'], file_name=r['file_name'])
-        else: st.info("Belum ada materi tersedia.")
+    if section == STUDENT_SECTIONS[0]:
+        fq = st.text_input("🔎 Cari Materi", key="mat_search")
+        if fq:
+            hits = search_materials(fq)
+            for r in hits: material_card(r, f"📄 {r['title']} · {r['category']}", r['snippet'])
+            if not hits: st.info("Materi tidak ditemukan.")
+        else:
+            df = get_materials()
+            if not df.empty:
+                cat = st.selectbox("📂 Filter Kategori Materi", sorted(df['category'].unique()))
+                st.divider()
+                for _, r in df[df['category']==cat].iterrows(): material_card(r, f"📄 {r['title']}")
+            else: st.info("Belum ada materi tersedia.")
 
     # TAB UJIAN (PAGINATION)
-    with tab2:
-        cats = sorted(list(set([e['category'] for e in all_qs]))) if all_qs else []
+    elif section == STUDENT_SECTIONS[1]:
+        cats = get_exam_categories()
         
         if st.session_state['selected_exam_cat'] is None:
             # GRID VIEW
@@ -636,7 +1829,7 @@ def student_dashboard():
             else:
                 cols = st.columns(3)
                 for i, cat in enumerate(cats):
-                    sch = get_schedule(cat)
+                    sch = overview.get(cat, {}).get('schedule')
                     stat_txt = "Tersedia"; stat_col = "#27ae60"
                     
                     if sch:
@@ -665,23 +1858,25 @@ def student_dashboard():
                 if st.button("⬅️ Kembali"):
                     st.session_state['selected_exam_cat'] = None
                     st.session_state.q_idx = 0
+                    if st.session_state.pop('start_pending', None): get_admission_queue().cancel((user['name'], pcat))
                     if "cat" in st.query_params: del st.query_params["cat"]
                     st.rerun()
             with c_title: st.markdown(f"## 📝 Ujian: {pcat}")
             
-            sch = get_schedule(pcat); show_exam = False
+            ov = overview.get(pcat, {}); sch = ov.get('schedule'); show_exam = False
             if sch:
                 odt = datetime.strptime(sch['open_time'], "%Y-%m-%d %H:%M:%S")
                 cdt = datetime.strptime(sch['close_time'], "%Y-%m-%d %H:%M:%S")
                 dur = sch['duration_minutes']
                 lim = sch['max_attempts']
-                cnt = get_student_result_count(user['name'], pcat)
-                att = get_student_attempt(user['name'], pcat)
+                cnt = ov['attempt_count']
+                att = ov['start_time']
                 now_wib = get_wib_now()
 
                 if att:
-                    dead = datetime.strptime(att['start_time'], "%Y-%m-%d %H:%M:%S") + timedelta(minutes=dur)
+                    dead = datetime.strptime(att, "%Y-%m-%d %H:%M:%S") + timedelta(minutes=dur)
                     if (dead - now_wib).total_seconds() > 0:
+                        st.session_state['active_attempt'] = (pcat, att)
                         with st.sidebar:
                             display_timer_js((dead - now_wib).total_seconds())
                         show_exam = True
@@ -691,144 +1886,54 @@ def student_dashboard():
                     elif now_wib < odt: st.warning(f"Ujian dibuka pada: {odt}")
                     elif now_wib > cdt: st.error("Ujian sudah ditutup.")
                     else:
-                        if st.button("🚀 MULAI UJIAN", type="primary"):
-                            start_student_exam(user['name'], pcat)
-                            # [FIX: DELAY AGAR DB SEMPAT SAVE]
-                            time.sleep(1.0)
-                            st.rerun()
+                        if st.session_state.get('start_pending') == pcat: exam_start_queue(user, pcat)
+                        elif st.button("🚀 MULAI UJIAN", type="primary"):
+                            st.session_state['start_pending'] = pcat
+                            exam_start_queue(user, pcat)
             else:
                 st.info("Mode Latihan (Tanpa Batas Waktu)"); show_exam = True
+                # Latihan tidak membuat baris attempt; kunci per sesi menjaga submit ulang tetap idempoten
+                st.session_state['practice_keys'].setdefault(pcat, attempt_key(user['name'], pcat, f"latihan-{os.urandom(8).hex()}"))
 
-            if show_exam:
-                raw = [e for e in all_qs if e['category']==pcat]
-                
-                # --- LOAD INITIAL DB DATA TO LOCAL STATE (ONCE) ---
-                if pcat not in st.session_state['local_answers']:
-                    st.session_state['local_answers'][pcat] = get_temp_answers_full(user['name'], pcat)
-                
-                local_data = st.session_state['local_answers'][pcat]
-                
-                # --- UPDATE RAM FUNCTION (NO DB CALL) ---
-                def update_ram(qid):
-                    # Callback ini hanya update Session State
-                    ans = st.session_state.get(f"rad_{qid}")
-                    dbt = st.session_state.get(f"chk_{qid}")
-                    if ans:
-                        local_data[qid] = {'answer': ans, 'doubt': dbt}
-
-                # --- NAVIGASI ---
-                def go_jump(idx): 
-                    # Simpan soal saat ini ke DB (Background) sebelum pindah
-                    curr_q = raw[st.session_state.q_idx]
-                    if curr_q['id'] in local_data:
-                        save_single_answer(user['name'], pcat, curr_q['id'], local_data[curr_q['id']]['answer'], local_data[curr_q['id']]['doubt'])
-                    st.session_state.q_idx = idx
-
-                # --- SIDEBAR NAVIGATION (READ RAM) ---
-                with st.sidebar:
-                    st.write("### 🧭 Navigasi Soal")
-                    cols = st.columns(5)
-                    for i, q in enumerate(raw):
-                        d = local_data.get(q['id'], {})
-                        # Color Logic (Baca RAM, jadi instan berubah)
-                        if i == st.session_state.q_idx: btn_type = "primary" # Active
-                        elif d.get('doubt'): btn_type = "secondary" # Ragu (Kuning via CSS/Emoji)
-                        elif d.get('answer'): btn_type = "primary" # Dijawab (Biru/Primary)
-                        else: btn_type = "secondary" # Kosong
-                        
-                        label = str(i+1)
-                        if d.get('doubt'): label = f"⚠️ {i+1}"
-                        elif d.get('answer'): label = f"✅ {i+1}"
-                        
-                        if cols[i%5].button(label, key=f"nav_{i}", type=btn_type, on_click=go_jump, args=(i,)):
-                            pass
-
-                # --- DISPLAY CURRENT QUESTION ---
-                current_q = raw[st.session_state.q_idx]
-                q_id = current_q['id']
-                
-                saved_val = local_data.get(q_id, {})
-                idx_sel = current_q['opsi'].index(saved_val.get('answer')) if saved_val.get('answer') in current_q['opsi'] else None
-
-                st.markdown(f"#### Soal No. {st.session_state.q_idx + 1}")
-                st.markdown(f"<div class='question-container'>{current_q['tanya']}</div>", unsafe_allow_html=True)
-                if current_q['q_img'] and isinstance(current_q['q_img'], bytes): st.image(current_q['q_img'], width=400)
-                
-                if len(current_q['opsi']) > 0:
-                    c_ops = st.columns(len(current_q['opsi']))
-                    for i, c in enumerate(c_ops):
-                        with c:
-                            if current_q['opsi_img'][i] and isinstance(current_q['opsi_img'][i], bytes): st.image(current_q['opsi_img'][i], width=100)
-
-                # --- INPUTS (ON CHANGE -> UPDATE RAM ONLY) ---
-                st.radio("Pilih Jawaban:", current_q['opsi'], index=idx_sel, key=f"rad_{q_id}", on_change=update_ram, args=(q_id,))
-                st.checkbox("🚩 Ragu-ragu", value=saved_val.get('doubt', False), key=f"chk_{q_id}", on_change=update_ram, args=(q_id,))
-                
-                st.divider()
-                
-                # --- BUTTONS ---
-                c_prev, c_dbt, c_next = st.columns([1, 2, 1])
-                
-                if c_prev.button("⬅️ Sebelumnya", disabled=(st.session_state.q_idx == 0)):
-                    # Save DB saat pindah
-                    if q_id in local_data: save_single_answer(user['name'], pcat, q_id, local_data[q_id]['answer'], local_data[q_id]['doubt'])
-                    st.session_state.q_idx -= 1
-                    st.rerun()
-
-                if st.session_state.q_idx < len(raw) - 1:
-                    if c_next.button("Selanjutnya ➡️", type="primary"):
-                        # Save DB saat pindah
-                        if q_id in local_data: save_single_answer(user['name'], pcat, q_id, local_data[q_id]['answer'], local_data[q_id]['doubt'])
-                        st.session_state.q_idx += 1
-                        st.rerun()
-                else:
-                    if c_next.button("✅ Kirim Selesai", type="primary"):
-                        # Save Last Question to DB
-                        if q_id in local_data: save_single_answer(user['name'], pcat, q_id, local_data[q_id]['answer'], local_data[q_id]['doubt'])
-                        
-                        # Hitung Nilai dari RAM (Data Paling Update)
-                        final_answers = local_data
-                        
-                        # Save All Batch (Backup)
-                        save_bulk_answers(user['name'], pcat, final_answers)
-                        
-                        sc = sum([1 for s in raw if final_answers.get(s['id'],{}).get('answer') == s['jawaban']])
-                        val = (sc/len(raw))*100 if raw else 0
-                        
-                        add_result(user['name'], pcat, val, len(raw), get_wib_now().strftime("%Y-%m-%d %H:%M:%S"))
-                        clear_student_attempt(user['name'], pcat)
-                        
-                        st.session_state['selected_exam_cat'] = None
-                        st.session_state.q_idx = 0
-                        st.query_params["exam_done"]="true"; st.query_params["cat"]=pcat; st.query_params["u_id"]=user['username']
-                        st.rerun()
+            if show_exam: exam_view(user, pcat)
 
     # TAB NILAI
-    with tab3:
-        df = get_results()
-        if not df.empty:
-            my_df = df[df['student_name'] == user['name']]
-            if not my_df.empty:
-                c1, c2 = st.columns(2)
-                c1.metric("Ujian Diikuti", len(my_df))
-                c2.metric("Rata-rata Score", f"{my_df['score'].mean():.1f}")
-                st.divider()
-                st.dataframe(my_df, use_container_width=True)
-            else: st.info("Anda belum mengikuti ujian apapun.")
-        else: st.info("Belum ada data nilai.")
+    else:
+        my_df = get_student_results(user['name'])
+        if not my_df.empty:
+            c1, c2 = st.columns(2)
+            c1.metric("Ujian Diikuti", len(my_df))
+            c2.metric("Rata-rata Score", f"{my_df['score'].mean():.1f}")
+            st.divider()
+            st.dataframe(my_df, use_container_width=True)
+        else: st.info("Anda belum mengikuti ujian apapun.")
 
 def main():
-    check_session_persistence()
-    if not st.session_state['current_user']: login_page()
-    else:
-        st.sidebar.write(f"👤 {st.session_state['current_user']['name']}")
-        with st.sidebar.expander("🔐 Ganti Password"):
-            op = st.text_input("Lama", type="password"); np = st.text_input("Baru", type="password")
-            if st.button("Simpan"):
-                u = st.session_state['current_user']['username']; d = get_user(u)
-                if d and d['password']==op: update_user_password(u, np); st.success("OK")
-        logout_button()
-        if st.session_state['current_user']['role'] == 'admin': admin_dashboard()
-        else: student_dashboard()
+    try: init_db()
+    except Exception as e: st.error(f"DB Init Error: {e}")
+    start_deadline_sweeper()
+    start_cache_warmer()
+    try: sync_content_versions()
+    except QueryError as e: print(f"Version Check Error: {e}")
+    stats = get_query_stats()
+    user = st.session_state['current_user']
+    stats.begin_rerun(user['role'] if user else "login")
+    try:
+        check_session_persistence()
+        if not st.session_state['current_user']: login_page()
+        else:
+            st.sidebar.write(f"👤 {st.session_state['current_user']['name']}")
+            with st.sidebar.expander("🔐 Ganti Password"):
+                op = st.text_input("Lama", type="password"); np = st.text_input("Baru", type="password")
+                if st.button("Simpan"):
+                    u = st.session_state['current_user']['username']; d = get_user(u)
+                    if d and d['password']==op: update_user_password(u, np); st.success("OK")
+            logout_button()
+            if st.session_state['current_user']['role'] == 'admin': admin_dashboard()
+            else: student_dashboard()
+    except QueryError as e:
+        st.error(f"Database Error: {e}")
+    finally:
+        stats.end_rerun()
 
 if __name__ == "__main__": main()